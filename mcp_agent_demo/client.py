@@ -5,7 +5,6 @@
 @time: 2025/4/24 18:17
 @file: server.py
 """
-import json
 import os
 
 """
@@ -13,109 +12,20 @@ import os
 2. 链接服务端
 3. 回收服务端的资源
 """
-from contextlib import AsyncExitStack
-from mcp import StdioServerParameters, ClientSession
-from mcp.client.stdio import stdio_client
 import sys, asyncio
 from dotenv import load_dotenv
 load_dotenv()
-import traceback
 
-from openai import OpenAI
+# 把仓库根目录加入模块搜索路径，以便导入公共的 mcp_common 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp_common import MCPClientCore
 
 
-class MCPClient(object):
-    def __init__(self):
-        self.session = None #上下文管理
-        self.stdio, self.write = None, None
-        self.exit_stack = AsyncExitStack()
-        # 从.env文件加载API配置
-        self.client = OpenAI(
-            api_key=os.environ.get("API_KEY"),
-            base_url=os.environ.get("BASE_URL")
-        )
-        self.model = os.environ.get("MODEL")  # 使用通义千问模型
-
-    async def cleanup(self):
-        await self.exit_stack.aclose()
-        print("清理完成")
-
-    async def connect_server(self, server_script_path):
-        if not server_script_path.endswith(".py"):
-            ValueError("服务端的脚本必须是python文件，请先检查")
-
-        #创建启动服务端服务的参数
-        server_params = StdioServerParameters(
-            command="python",
-            args=[server_script_path],
-            env = None
-        )
-
-        #启动服务
-        self.stdio, self.write = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-        await self.session.initialize()
-        #调用查看都有那些工具
-        response = await self.session.list_tools()
-        print("链接服务器成功，服务段支持一下工具:", [tool.name for tool in response.tools])
-
-    async def process_query(self, query):
-        messages = [{"role": "user", "content": query}]
-        tools_info = await self.session.list_tools()
-
-
-        available_tools = [{
-            "type": "function",
-            "function": {
-                "name": tool.name,
-                "description": tool.description,
-                "input_schema": tool.inputSchema
-            }
-        } for tool in tools_info.tools]
-
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            tools=available_tools
-        )
-
-        message = response.choices[0].message
-        if response.choices[0].finish_reason == "tool_calls":
-            tool_call = message.tool_calls[0]
-            tool_name = tool_call.function.name
-            tool_args = json.loads(tool_call.function.arguments)
-
-            # 执行工具
-            result = await self.session.call_tool(tool_name, tool_args)
-            print(f"执行的工具名: {tool_name}, 参数: {tool_args}")
-
-            messages.append(message.model_dump())
-            messages.append({
-                "role": "tool",
-                "content": result.content[0].text,
-                "tool_call_id": tool_call.id
-            })
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages
-            )
-            return response.choices[0].message.content
-        return message.content
+class MCPClient(MCPClientCore):
+    """天气查询客户端，LLM调用、工具缓存和会话管理见 mcp_common.MCPClientCore"""
 
     async def chat(self):
-        print("exit[退出]")
-        while True:
-            try:
-                query = input("请输入:")
-                if query.lower() == "exit":
-                    break
-                # 这里注释掉原本会出错的代码，暂时打印提示信息
-                response = await self.process_query(query)
-                print(f"结果: {response}")
-
-            except Exception as err:
-                traceback.print_stack()
-                print(f"异常：{str(err)}")
+        await super().chat(commands="exit[退出]")
 
 
 async def main():
@@ -131,4 +41,4 @@ async def main():
     print("over")
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -7,10 +7,18 @@ from mcp.server.fastmcp import FastMCP
 import httpx
 import json
 import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp_common.server_runtime import AdmissionController, add_transport_arguments, run_server
 from dotenv import load_dotenv
 load_dotenv()
 #创建一个对象
 mcp = FastMCP("weather")
+# 同时执行的天气查询数上限与排队上限
+admission = AdmissionController(
+    int(os.getenv("WEATHER_MAX_CONCURRENCY", "16")),
+    int(os.getenv("WEATHER_MAX_QUEUE", "64"))
+)
 
 
 async def get_weather(city: str) -> dict[str, Any]:
@@ -59,6 +67,7 @@ async def format_data(json_data):
 
 #定义成一个工具
 @mcp.tool()
+@admission.guard
 async def query_weather(city: str) -> str:
     """
     输入指定的城市名(英文)，返回今日天气情况
@@ -91,6 +100,10 @@ if __name__ == "__main__":
     4. 客户端连接服务器:
         python client.py server.py
 
+    5. 以网络服务运行，多个客户端共享一个进程:
+        python server.py --transport streamable-http --port 8000
+        python client.py http://127.0.0.1:8000/mcp
+
 两种模式的区别:
     - server模式: 启动MCP服务器，等待客户端连接，用于与其他系统集成
     - test模式: 直接执行天气查询并显示结果，用于快速测试功能
@@ -100,6 +113,7 @@ if __name__ == "__main__":
                       help='运行模式：server(启动服务器)或test(运行测试)')
     parser.add_argument('--city', type=str, default='Shenzhen',
                       help='测试模式下的查询城市')
+    add_transport_arguments(parser, default_port=8000, admission=admission)
     
     args = parser.parse_args()
     
@@ -107,7 +121,7 @@ if __name__ == "__main__":
         '''启动MCP服务器，用于与客户端联调'''        
         print("启动Weather MCP服务器...")
         print("使用 'python client.py server.py' 命令连接客户端")
-        mcp.run(transport="stdio")
+        run_server(mcp, args, admission)
     else:
         '''运行测试模式，直接执行天气查询'''
         print(f"测试天气查询：城市={args.city}")
@@ -0,0 +1,6 @@
+# -*- encoding: utf-8 -*-
+
+from .client_core import DEFAULT_CONVERSATION, MCPClientCore, tool_result_text
+from .server_pool import MCPServerPool, ServerConnection
+
+__all__ = ["DEFAULT_CONVERSATION", "MCPClientCore", "MCPServerPool", "ServerConnection", "tool_result_text"]
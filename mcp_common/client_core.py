@@ -0,0 +1,294 @@
+# -*- encoding: utf-8 -*-
+
+"""
+MCP客户端的公共部分，mcp_agent_demo / mcp_rag_langchain / mcp_rag_agent_graphrag_demo 三个客户端共用
+
+1.LLM调用使用 AsyncOpenAI，底层是带连接池和keep-alive的 httpx.AsyncClient，等待模型回复时不阻塞事件循环
+2.工具列表只在连接时获取一次并缓存，服务端发出 ToolListChangedNotification 后再重新获取
+3.每个会话(conversation_id)有独立的消息历史，多个会话可以在同一个连接上并发处理
+4.LLM一轮返回的多个工具调用并发执行，可多轮调用工具，每个工具有超时限制
+5.流式模式下回复逐token输出，工具调用的参数一拼接完整就开始执行；
+  工具通过进度通知逐段返回的内容(如 graphrag 的 *_stream_asearch)同样交给 on_token 输出
+6.可以通过 MCPServerPool 同时使用多个服务的工具(见 server_pool.py、multi_client.py)
+"""
+
+import asyncio
+import json
+import os
+import traceback
+from contextlib import AsyncExitStack
+
+import httpx
+from mcp import ClientSession, types
+from openai import AsyncOpenAI
+
+from .server_pool import MCPServerPool
+from .transport import open_transport
+
+DEFAULT_CONVERSATION = "default"
+
+
+def _is_complete_json(text):
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def tool_result_text(result):
+    """把 call_tool 的结果拼成文本，作为 tool 消息的内容"""
+    texts = [content.text for content in result.content if getattr(content, "text", None) is not None]
+    return "\n".join(texts)
+
+
+class MCPClientCore(object):
+    def __init__(self, system_prompt=None, verify=True, max_connections=20,
+                 tool_timeout=60, tool_timeouts=None, max_iterations=5, stream=True, pool=None):
+        """
+        :param tool_timeout: 单个工具调用的默认超时秒数，tool_timeouts 可按工具名单独设置
+        :param max_iterations: 一次提问中LLM调用工具的最大轮数
+        :param stream: 是否以流式方式请求LLM
+        :param pool: 共享的 MCPServerPool，设置后工具列表和工具调用都经由连接池，不再使用单个会话
+        """
+        self.session = None
+        self.exit_stack = AsyncExitStack()
+        self.http_client = httpx.AsyncClient(
+            verify=verify,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(120, connect=10)
+        )
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("API_KEY"),
+            base_url=os.getenv("BASE_URL"),
+            http_client=self.http_client
+        )
+        self.model = os.getenv("MODEL")
+        self.system_prompt = system_prompt
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.max_iterations = max_iterations
+        self.stream = stream
+        self.pool = pool
+        self.conversations = {}
+        self._tools = None
+        self._tools_lock = asyncio.Lock()
+
+    async def cleanup(self):
+        await self.exit_stack.aclose()
+        await self.http_client.aclose()
+        print("清理完成")
+
+    async def _handle_message(self, message):
+        """服务端通知：工具列表变化时让缓存失效"""
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self._tools = None
+
+    async def connect_server(self, server):
+        """server 为服务端脚本路径(以stdio子进程启动)或已启动服务的URL，见 transport.py"""
+        read, write = await self.exit_stack.enter_async_context(open_transport(server))
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(read, write, message_handler=self._handle_message)
+        )
+        await self.session.initialize()
+        tools = await self.get_tools(refresh=True)
+        print("链接服务器成功，服务段支持一下工具:", [tool["function"]["name"] for tool in tools])
+
+    async def connect_servers(self, servers):
+        """连接多个MCP服务，servers 为 服务名 -> 服务端脚本路径或URL；连接池随 cleanup 关闭"""
+        self.pool = await self.exit_stack.enter_async_context(MCPServerPool(servers))
+        tools = await self.get_tools()
+        print("链接服务器成功，服务段支持一下工具:", [tool["function"]["name"] for tool in tools])
+
+    async def get_tools(self, refresh=False):
+        """返回OpenAI格式的工具列表，缓存失效或 refresh 时才向服务端请求"""
+        if self.pool is not None:
+            return await self.pool.get_tools()
+        async with self._tools_lock:
+            if self._tools is None or refresh:
+                tools_info = await self.session.list_tools()
+                self._tools = [{
+                    "type": "function",
+                    "function": {
+                        "name": tool.name,
+                        "description": tool.description,
+                        "parameters": tool.inputSchema
+                    }
+                } for tool in tools_info.tools]
+            return self._tools
+
+    def new_conversation(self, conversation_id=DEFAULT_CONVERSATION):
+        self.conversations[conversation_id] = (
+            [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        )
+        return self.conversations[conversation_id]
+
+    def _tool_timeout(self, tool_name):
+        return self.tool_timeouts.get(tool_name, self.tool_timeout)
+
+    async def call_tool(self, tool_name, arguments, on_token=None):
+        """
+        执行一个工具调用并返回作为 tool 消息内容的文本，参数错误、超时和异常都转成文本交给LLM处理；
+        设置 on_token 时，工具进度通知中的文本片段到达即交给 on_token
+        """
+        try:
+            tool_args = json.loads(arguments or "{}")
+        except json.JSONDecodeError as err:
+            return f"工具 {tool_name} 的参数不是合法的JSON: {err}"
+        progress_callback = None
+        if on_token:
+            async def progress_callback(progress, total, message):
+                if message:
+                    on_token(message)
+        timeout = self._tool_timeout(tool_name)
+        try:
+            session = self.pool if self.pool is not None else self.session
+            result = await asyncio.wait_for(
+                session.call_tool(tool_name, tool_args, progress_callback=progress_callback), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            return f"工具 {tool_name} 执行超时({timeout}s)"
+        except Exception as err:
+            return f"工具 {tool_name} 执行失败: {err}"
+        print(f"执行的工具名: {tool_name}, 参数: {tool_args}")
+        return tool_result_text(result)
+
+    async def _complete_turn(self, messages, tools, on_token=None):
+        """非流式的一轮：返回 (回复文本, 工具调用列表, 工具结果列表)"""
+        kwargs = {"tools": tools} if tools else {}
+        response = await self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        message = response.choices[0].message
+        tool_calls = [
+            {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+            for call in message.tool_calls or []
+        ]
+        results = await asyncio.gather(
+            *[self.call_tool(call["name"], call["arguments"], on_token) for call in tool_calls]
+        )
+        return message.content, tool_calls, list(results)
+
+    async def _stream_turn(self, messages, tools, on_token):
+        """
+        流式的一轮：回复的token到达即交给 on_token；工具调用的参数随增量拼接，
+        参数拼成完整的JSON(或下一个工具调用开始)时立即开始执行该工具，不等整个回复结束
+        """
+        kwargs = {"tools": tools} if tools else {}
+        stream = await self.client.chat.completions.create(
+            model=self.model, messages=messages, stream=True, **kwargs
+        )
+        content, calls, tasks = [], {}, {}
+
+        def start(index):
+            if index not in tasks:
+                tasks[index] = asyncio.create_task(
+                    self.call_tool(calls[index]["name"], calls[index]["arguments"], on_token)
+                )
+
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    if on_token:
+                        on_token(delta.content)
+                for item in delta.tool_calls or []:
+                    for index in calls:
+                        if index < item.index:
+                            start(index)
+                    call = calls.setdefault(item.index, {"id": "", "name": "", "arguments": ""})
+                    if item.id:
+                        call["id"] = item.id
+                    if item.function and item.function.name:
+                        call["name"] += item.function.name
+                    if item.function and item.function.arguments:
+                        call["arguments"] += item.function.arguments
+                        if _is_complete_json(call["arguments"]):
+                            start(item.index)
+            for index in calls:
+                start(index)
+            order = sorted(calls)
+            results = await asyncio.gather(*[tasks[index] for index in order])
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return "".join(content) or None, [calls[index] for index in order], list(results)
+
+    async def _run_turn(self, messages, tools, on_token):
+        if self.stream:
+            return await self._stream_turn(messages, tools, on_token)
+        return await self._complete_turn(messages, tools, on_token)
+
+    async def process_query(self, query, conversation_id=DEFAULT_CONVERSATION, on_token=None):
+        """
+        agent循环：LLM每轮返回的所有工具调用并发执行，结果按调用顺序追加到消息中再交给LLM，
+        直到LLM不再调用工具；超过 max_iterations 轮时不再提供工具，要求LLM直接回答。
+        流式模式下回复的token到达时调用 on_token(text)
+        """
+        messages = self.conversations.get(conversation_id) or self.new_conversation(conversation_id)
+        messages.append({"role": "user", "content": query})
+
+        for _ in range(self.max_iterations):
+            content, tool_calls, results = await self._run_turn(messages, await self.get_tools(), on_token)
+            if not tool_calls:
+                break
+            messages.append({
+                "role": "assistant",
+                "content": content,
+                "tool_calls": [{
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": call["arguments"]}
+                } for call in tool_calls]
+            })
+            for call, result in zip(tool_calls, results):
+                messages.append({
+                    "role": "tool",
+                    "content": result,
+                    "tool_call_id": call["id"]
+                })
+        else:
+            content, _, _ = await self._run_turn(messages, None, on_token)
+        messages.append({"role": "assistant", "content": content})
+        return content
+
+    @staticmethod
+    def _print_token():
+        """流式输出：收到第一个token时先打印前缀"""
+        started = []
+
+        def on_token(text):
+            if not started:
+                started.append(True)
+                print("结果: ", end="", flush=True)
+            print(text, end="", flush=True)
+        return on_token
+
+    async def chat(self, commands="exit[退出], restart[开启新一轮对话]"):
+        print(commands)
+        while True:
+            try:
+                # input 放到线程中执行，等待输入时其他会话的请求仍可继续处理
+                query = await asyncio.to_thread(input, "请输入:")
+                if query.lower() == "exit":
+                    break
+                if query.lower() == "restart":
+                    self.new_conversation()
+                    continue
+
+                if self.stream:
+                    await self.process_query(query, on_token=self._print_token())
+                    print()
+                else:
+                    response = await self.process_query(query)
+                    print(f"结果: {response}")
+
+            except Exception as err:
+                traceback.print_exc()
+                print(f"异常：{str(err)}")
@@ -0,0 +1,61 @@
+# -*- encoding: utf-8 -*-
+
+"""
+同时连接天气、rag、graphrag三个MCP服务的客户端
+
+服务进程由 MCPServerPool 常驻维护，工具调用按工具名路由到对应服务，服务退出后自动重连。
+在仓库根目录运行:
+    python mcp_common/multi_client.py
+    python mcp_common/multi_client.py --server weather=mcp_agent_demo/server.py --server rag=mcp_rag_langchain/rag_server.py
+    # 连接已用 --transport streamable-http 启动的服务
+    python mcp_common/multi_client.py --server rag=http://127.0.0.1:8001/mcp --server graphrag=http://127.0.0.1:8002/mcp
+"""
+
+import asyncio
+import os
+import sys
+from argparse import ArgumentParser
+
+from dotenv import load_dotenv
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 把仓库根目录加入模块搜索路径，以便导入公共的 mcp_common 包
+sys.path.insert(0, ROOT_DIR)
+from mcp_common import MCPClientCore, MCPServerPool
+
+DEFAULT_SERVERS = {
+    "weather": os.path.join(ROOT_DIR, "mcp_agent_demo", "server.py"),
+    "rag": os.path.join(ROOT_DIR, "mcp_rag_langchain", "rag_server.py"),
+    "graphrag": os.path.join(ROOT_DIR, "mcp_rag_agent_graphrag_demo", "graphrag_server.py"),
+}
+
+
+def parse_servers(items):
+    servers = {}
+    for item in items:
+        name, _, path = item.partition("=")
+        if not path:
+            raise ValueError(f"服务参数应为 名称=脚本路径或URL: {item}")
+        servers[name] = path
+    return servers
+
+
+async def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--server", action="append", default=[], help="名称=服务端脚本路径或URL，可重复指定")
+    args = parser.parse_args()
+    load_dotenv()
+
+    servers = parse_servers(args.server) if args.server else DEFAULT_SERVERS
+    async with MCPServerPool(servers) as pool:
+        client = MCPClientCore(system_prompt="you are a helpful assistant", tool_timeout=300, pool=pool)
+        try:
+            print("链接服务器成功，服务段支持一下工具:", [tool["function"]["name"] for tool in await pool.get_tools()])
+            await client.chat()
+        finally:
+            await client.cleanup()
+    print("over")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+# -*- encoding: utf-8 -*-
+
+"""
+多个MCP服务的常驻连接池
+
+1.同时连接多个服务(天气、rag、graphrag)，合并它们的工具列表，按工具名把调用路由到对应的服务；
+  不同服务的工具重名时，后出现的工具以"服务名_工具名"对外暴露
+2.服务可以是本地脚本(stdio子进程)，也可以是已启动的网络服务URL；每个服务的连接由一个后台任务维护，定期ping检查，进程退出或连接断开后按指数退避重连
+3.连接池独立于对话存在，多轮对话、多个客户端共用同一组已预热的服务进程，
+  只在第一次启动时付出GraphRAG索引、Chroma和向量模型的加载开销
+"""
+
+import asyncio
+import sys
+
+from mcp import ClientSession, types
+from mcp.shared.exceptions import McpError
+
+from .transport import open_transport
+
+
+class ServerConnection(object):
+    """一个MCP服务的连接，由后台任务负责建立、保活和断线重连"""
+
+    def __init__(self, name, target, on_tools_changed, backoff=1.0, max_backoff=30.0, ping_interval=30.0):
+        self.name = name
+        self.target = target
+        self.on_tools_changed = on_tools_changed
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.ping_interval = ping_interval
+        self.session = None
+        self.tools = []
+        self._ready = asyncio.Event()
+        self._broken = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name=f"mcp-{self.name}")
+
+    async def stop(self):
+        self._stopping.set()
+        self._broken.set()
+        if self._task is not None:
+            await self._task
+
+    async def _handle_message(self, message):
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            asyncio.create_task(self._refresh_tools())
+
+    async def _refresh_tools(self):
+        session = self.session
+        if session is None:
+            return
+        try:
+            self.tools = (await session.list_tools()).tools
+        except Exception as err:
+            print(f"MCP服务 {self.name} 获取工具列表失败: {err}", file=sys.stderr)
+            return
+        self.on_tools_changed()
+
+    async def _keep_alive(self, session):
+        """等待停止或断线；空闲时定期ping，服务进程退出时尽早发现"""
+        while not self._broken.is_set():
+            try:
+                await asyncio.wait_for(self._broken.wait(), timeout=self.ping_interval)
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.wait_for(session.send_ping(), timeout=10)
+                except Exception as err:
+                    print(f"MCP服务 {self.name} 无响应: {err}", file=sys.stderr)
+                    return
+
+    async def _run(self):
+        attempt = 0
+        while not self._stopping.is_set():
+            try:
+                async with open_transport(self.target) as (read, write):
+                    async with ClientSession(read, write, message_handler=self._handle_message) as session:
+                        await session.initialize()
+                        self.tools = (await session.list_tools()).tools
+                        self.session = session
+                        attempt = 0
+                        self._broken.clear()
+                        self._ready.set()
+                        self.on_tools_changed()
+                        print(f"已连接MCP服务 {self.name}: {[tool.name for tool in self.tools]}", file=sys.stderr)
+                        await self._keep_alive(session)
+            except Exception as err:
+                print(f"MCP服务 {self.name} 连接断开: {err}", file=sys.stderr)
+            finally:
+                self.session = None
+                self._ready.clear()
+            if self._stopping.is_set():
+                break
+            self.tools = []
+            self.on_tools_changed()
+            delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+            attempt += 1
+            print(f"{delay:.0f}s 后重连MCP服务 {self.name}", file=sys.stderr)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_ready(self, timeout=None):
+        await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        return self.session
+
+    async def call_tool(self, tool_name, arguments, connect_timeout=60, progress_callback=None):
+        session = await self.wait_ready(connect_timeout)
+        try:
+            return await session.call_tool(tool_name, arguments, progress_callback=progress_callback)
+        except McpError as err:
+            if err.error.code == types.CONNECTION_CLOSED:
+                self._broken.set()
+            raise
+        except (ConnectionError, EOFError, OSError):
+            self._broken.set()
+            raise
+
+
+class MCPServerPool(object):
+    """
+    多个MCP服务的连接池，接口与 MCPClientCore 使用的单个会话一致:
+        async with MCPServerPool({"weather": "mcp_agent_demo/server.py", ...}) as pool:
+            tools = await pool.get_tools()
+            result = await pool.call_tool("query_weather", {"city": "Beijing"})
+    """
+
+    def __init__(self, servers, connect_timeout=120, **connection_kwargs):
+        """
+        :param servers: 服务名 -> 服务端脚本路径、服务URL(见 transport.py)或 StdioServerParameters
+        :param connect_timeout: 启动时等待每个服务就绪的秒数，超时的服务在后台继续重连
+        """
+        self.connect_timeout = connect_timeout
+        self.connections = {
+            name: ServerConnection(
+                name,
+                server,
+                self._invalidate,
+                **connection_kwargs
+            )
+            for name, server in servers.items()
+        }
+        self._tools = None
+        self._routes = {}
+
+    def _invalidate(self):
+        self._tools = None
+
+    async def __aenter__(self):
+        for connection in self.connections.values():
+            connection.start()
+        results = await asyncio.gather(
+            *[connection.wait_ready(self.connect_timeout) for connection in self.connections.values()],
+            return_exceptions=True
+        )
+        for name, result in zip(self.connections, results):
+            if isinstance(result, BaseException):
+                print(f"MCP服务 {name} 未能在{self.connect_timeout}s内就绪，将在后台继续重连", file=sys.stderr)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.gather(*[connection.stop() for connection in self.connections.values()])
+
+    async def get_tools(self):
+        """合并后的OpenAI格式工具列表，任一服务重连或工具变化后重新生成"""
+        if self._tools is None:
+            tools, routes = [], {}
+            for name, connection in self.connections.items():
+                for tool in connection.tools:
+                    exposed = tool.name if tool.name not in routes else f"{name}_{tool.name}"
+                    routes[exposed] = (name, tool.name)
+                    tools.append({
+                        "type": "function",
+                        "function": {
+                            "name": exposed,
+                            "description": tool.description,
+                            "parameters": tool.inputSchema
+                        }
+                    })
+            self._tools, self._routes = tools, routes
+        return self._tools
+
+    async def call_tool(self, tool_name, arguments, progress_callback=None):
+        if tool_name not in self._routes:
+            await self.get_tools()
+        if tool_name not in self._routes:
+            raise ValueError(f"没有服务提供工具: {tool_name}")
+        server, name = self._routes[tool_name]
+        return await self.connections[server].call_tool(name, arguments, progress_callback=progress_callback)
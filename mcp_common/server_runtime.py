@@ -0,0 +1,146 @@
+# -*- encoding: utf-8 -*-
+
+"""
+MCP服务端的公共部分，server.py / rag_server.py / graphrag_server.py 共用
+
+1.--transport 选择 stdio(默认，一个进程服务一个客户端) 或 sse / streamable-http，
+  网络模式下一个已预热的服务进程同时服务多个客户端，模型、向量库和GraphRAG索引只加载一份
+2.AdmissionController 做准入控制：同时执行的工具调用数有上限，排队的请求数也有上限，
+  队列已满时立即返回"服务繁忙"，而不是让请求无限堆积
+"""
+
+import asyncio
+import functools
+import socket
+import sys
+
+from mcp.server.transport_security import TransportSecuritySettings
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+WILDCARD_HOSTS = ("0.0.0.0", "::", "")
+
+
+class ServerBusyError(RuntimeError):
+    pass
+
+
+class AdmissionController(object):
+    """并发上限 + 排队上限的准入控制，用作 async with 或工具函数的装饰器"""
+
+    def __init__(self, max_concurrency=8, max_queue=32):
+        self.configure(max_concurrency, max_queue)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def configure(self, max_concurrency=None, max_queue=None):
+        """服务启动前按命令行参数调整，不能在有请求执行时调用"""
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+            self._semaphore = asyncio.Semaphore(max_concurrency)
+        if max_queue is not None:
+            self.max_queue = max_queue
+
+    async def __aenter__(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ServerBusyError(f"服务繁忙: {self.active}个请求正在执行，{self.waiting}个请求在排队，请稍后重试")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self._semaphore.release()
+
+    def guard(self, fn):
+        """工具函数的装饰器，放在 @mcp.tool() 之下"""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            async with self:
+                return await fn(*args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+def add_transport_arguments(parser, default_port, admission=None):
+    parser.add_argument('--transport', type=str, choices=['stdio', 'sse', 'streamable-http'], default='stdio',
+                        help='传输方式：stdio(由客户端启动子进程)或sse/streamable-http(多个客户端共享一个服务进程)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='网络模式下监听的地址')
+    parser.add_argument('--port', type=int, default=default_port, help='网络模式下监听的端口')
+    parser.add_argument('--allowed-host', action='append', default=[],
+                        help='除本机地址外额外允许的Host请求头(如 rag.example.com:8001)，可重复指定；'
+                             '指定 * 时关闭DNS rebinding防护')
+    if admission is not None:
+        parser.add_argument('--max-concurrency', type=int, default=admission.max_concurrency,
+                            help='同时执行的工具调用数上限')
+        parser.add_argument('--max-queue', type=int, default=admission.max_queue,
+                            help='排队等待的请求数上限，超出时直接返回服务繁忙')
+
+
+def local_addresses(host):
+    """
+    监听地址对应的本机地址：监听 0.0.0.0 / :: 时为回环地址、主机名及其解析出的地址，
+    以及默认路由的出口地址；监听具体地址时为该地址
+    """
+    if host not in WILDCARD_HOSTS:
+        return {host}
+    hostname = socket.gethostname()
+    addresses = set(LOOPBACK_HOSTS) | {hostname, socket.getfqdn()}
+    try:
+        addresses.update(info[4][0] for info in socket.getaddrinfo(hostname, None))
+    except OSError:
+        pass
+    for family, probe in ((socket.AF_INET, "10.255.255.255"), (socket.AF_INET6, "fd00::1")):
+        # UDP connect 不发送数据，只用来取得出口网卡的地址
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            try:
+                sock.connect((probe, 1))
+                addresses.add(sock.getsockname()[0])
+            except OSError:
+                pass
+    return addresses
+
+
+def _host_header(address, port):
+    return f"[{address}]:{port}" if ":" in address else f"{address}:{port}"
+
+
+def transport_security(host, port, allowed_hosts=()):
+    """
+    FastMCP 按构造时的host决定DNS rebinding防护：默认的127.0.0.1只允许本机Host头，
+    监听其他地址时按本机实际地址和端口重新生成允许列表，否则其他机器通过IP访问会被拒绝
+    """
+    if "*" in allowed_hosts:
+        print("警告: 已关闭DNS rebinding防护，任意Host请求头都会被接受", file=sys.stderr)
+        return TransportSecuritySettings(enable_dns_rebinding_protection=False)
+    hosts = sorted({_host_header(address, port) for address in local_addresses(host)} | set(allowed_hosts))
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=hosts,
+        allowed_origins=[f"http://{item}" for item in hosts]
+    )
+
+
+def run_server(mcp, args, admission=None):
+    if admission is not None:
+        admission.configure(args.max_concurrency, args.max_queue)
+    if args.transport != 'stdio':
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port
+        mcp.settings.transport_security = transport_security(args.host, args.port, args.allowed_host)
+        path = mcp.settings.sse_path if args.transport == 'sse' else mcp.settings.streamable_http_path
+        print(f"MCP服务地址: http://{args.host}:{args.port}{path}")
+    mcp.run(transport=args.transport)
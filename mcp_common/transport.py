@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+
+"""
+客户端连接MCP服务的传输方式
+
+服务可以用三种方式指定:
+    mcp_rag_langchain/rag_server.py     本地脚本，以stdio子进程方式启动
+    http://127.0.0.1:8001/mcp           已启动的 streamable-http 服务
+    http://127.0.0.1:8001/sse           已启动的 SSE 服务
+"""
+
+import sys
+from contextlib import asynccontextmanager
+
+from mcp import StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+
+def is_url(target):
+    return isinstance(target, str) and target.startswith(("http://", "https://"))
+
+
+def stdio_params(server_script_path):
+    if not server_script_path.endswith(".py"):
+        raise ValueError("服务端的脚本必须是python文件，请先检查")
+    return StdioServerParameters(
+        command=sys.executable,
+        args=[server_script_path],
+        env=None,
+        encoding='utf-8',
+        errors='replace'
+    )
+
+
+@asynccontextmanager
+async def open_transport(target):
+    """按服务的指定方式建立连接，产出 (read, write) 流"""
+    if is_url(target):
+        if target.rstrip("/").endswith("/sse"):
+            async with sse_client(target) as (read, write):
+                yield read, write
+        else:
+            async with streamablehttp_client(target) as (read, write, _):
+                yield read, write
+    else:
+        params = stdio_params(target) if isinstance(target, str) else target
+        async with stdio_client(params) as (read, write):
+            yield read, write
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+'''按查询语义相似度命中的回答缓存
+
+新问题的查询向量与已缓存问题的余弦相似度超过阈值时直接返回缓存的回答。
+每条记录保存生成它时的索引版本（create_final_*.parquet 与 lancedb 目录的文件指纹），
+索引变化后旧版本的记录自动失效并被清除。查询时派生的文件（如社区报告向量
+*_with_embeddings.parquet）不计入指纹，写入它们不会使缓存失效。
+'''
+
+import glob
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# 由 report_embeddings.py 在查询时生成，不属于索引本身
+DERIVED_SUFFIX = '_with_embeddings.parquet'
+
+
+def index_version(data_dir: str) -> str:
+    '''索引目录的版本指纹，任一索引文件的大小或修改时间变化都会得到新的版本'''
+    paths = sorted(
+        path for path in glob.glob(os.path.join(data_dir, 'create_final_*.parquet'))
+        if not path.endswith(DERIVED_SUFFIX)
+    )
+    for root, _, files in os.walk(os.path.join(data_dir, 'lancedb')):
+        paths.extend(sorted(os.path.join(root, name) for name in files))
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f'{os.path.relpath(path, data_dir)}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class SemanticAnswerCache(object):
+    '''持久化的语义回答缓存，只在内存中保留当前索引版本的记录'''
+
+    def __init__(self, path: str, data_dir: str, threshold: float = 0.95, max_entries: int = 2_000):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.data_dir = data_dir
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS answers '
+            '(id INTEGER PRIMARY KEY, query TEXT, embedding BLOB, answer TEXT, index_version TEXT, created REAL)'
+        )
+        self._conn.commit()
+        self._version = None
+        self._queries, self._answers, self._matrix = [], [], np.zeros((0, 0))
+
+    def _refresh(self) -> str:
+        '''索引版本变化时清除旧版本记录并重新载入当前版本的记录'''
+        version = index_version(self.data_dir)
+        if version != self._version:
+            self._conn.execute('DELETE FROM answers WHERE index_version != ?', (version,))
+            self._conn.commit()
+            rows = self._conn.execute(
+                'SELECT query, embedding, answer FROM answers WHERE index_version = ? ORDER BY id DESC LIMIT ?',
+                (version, self.max_entries)
+            ).fetchall()
+            self._queries = [row[0] for row in rows]
+            self._answers = [row[2] for row in rows]
+            vectors = [np.frombuffer(row[1], dtype=np.float64) for row in rows]
+            self._matrix = np.vstack(vectors) if vectors else np.zeros((0, 0))
+            self._version = version
+        return version
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float64)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def set_data_dir(self, data_dir: str):
+        '''索引目录切换后按新目录计算版本，下次访问时重新载入'''
+        with self._lock:
+            self.data_dir = data_dir
+            self._version = None
+
+    def version(self) -> str:
+        with self._lock:
+            return self._refresh()
+
+    def lookup(self, embedding) -> str | None:
+        '''返回相似度最高且超过阈值的缓存回答'''
+        with self._lock:
+            self._refresh()
+            if len(self._answers):
+                scores = self._matrix @ self._normalize(embedding)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return self._answers[best]
+            self.misses += 1
+            return None
+
+    def add(self, query: str, embedding, answer: str, version: str):
+        '''version 应取自生成回答之前，避免把旧索引上生成的回答记到新版本下'''
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO answers (query, embedding, answer, index_version, created) VALUES (?, ?, ?, ?, ?)',
+                (query, vector.tobytes(), answer, version, time.time())
+            )
+            self._conn.execute(
+                'DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY id DESC LIMIT ?)',
+                (self.max_entries,)
+            )
+            self._conn.commit()
+            if version == self._version:
+                self._queries = [query] + self._queries[:self.max_entries - 1]
+                self._answers = [answer] + self._answers[:self.max_entries - 1]
+                rows = [vector] + list(self._matrix[:self.max_entries - 1])
+                self._matrix = np.vstack(rows)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._answers),
+            'index_version': self._version,
+        }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+'''查询阶段的持久化缓存
+
+SqliteLRUStore 是一个按条数限容、按最近访问淘汰的磁盘键值存储；
+CachedTextEmbedding 包装 graphrag 的 text embedder，相同（模型, 规范化文本）的查询只向
+embedding 服务请求一次，同步和异步两条调用路径共用同一份缓存。
+'''
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Any
+
+from graphrag.query.llm.base import BaseTextEmbedding
+
+
+class SqliteLRUStore(object):
+    '''磁盘键值存储，超过 max_entries 时淘汰最久未访问的条目
+
+    命中时的访问时间先记在内存中，积累 flush_every 条或写入新条目时再批量落盘，
+    命中路径上只有一次 SELECT，不做提交
+    '''
+
+    def __init__(self, path: str, max_entries: int = 10_000, flush_every: int = 256):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # WAL 模式下 NORMAL 不会损坏数据库，断电时最多丢失最近的几次提交，对缓存可以接受
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, last_access REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self._conn.commit()
+        self._touched = {}
+
+    def _flush_access(self):
+        '''把内存中的访问时间写回，调用方需持有锁并负责提交'''
+        if self._touched:
+            self._conn.executemany(
+                'UPDATE entries SET last_access = ? WHERE key = ?',
+                [(last_access, key) for key, last_access in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.flush_every:
+                self._flush_access()
+                self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            # 淘汰前先写回访问时间，最近命中过的条目不会被当作最久未访问
+            self._flush_access()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, last_access) VALUES (?, ?, ?)',
+                (key, value, time.time())
+            )
+            overflow = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    'DELETE FROM entries WHERE key IN '
+                    '(SELECT key FROM entries ORDER BY last_access LIMIT ?)',
+                    (overflow,)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute('DELETE FROM entries')
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': size,
+            'max_entries': self.max_entries,
+        }
+
+
+def normalize_text(text: str) -> str:
+    '''全角/半角统一、去首尾空白并合并连续空白'''
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+class CachedTextEmbedding(BaseTextEmbedding):
+    '''带持久化缓存的查询向量化，其余属性透传给被包装的 embedder'''
+
+    def __init__(self, embedder: BaseTextEmbedding, store: SqliteLRUStore, model: str):
+        self.embedder = embedder
+        self.store = store
+        self.model = model
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f'{self.model}\n{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+    def _lookup(self, key: str) -> list[float] | None:
+        value = self.store.get(key)
+        return None if value is None else array('d', value).tolist()
+
+    def _save(self, key: str, embedding: list[float]):
+        self.store.set(key, array('d', embedding).tobytes())
+
+    def embed(self, text: str, **kwargs: Any) -> list[float]:
+        key = self._key(text)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = self.embedder.embed(text, **kwargs)
+            self._save(key, embedding)
+        return embedding
+
+    async def aembed(self, text: str, **kwargs: Any) -> list[float]:
+        key = self._key(text)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = await self.embedder.aembed(text, **kwargs)
+            self._save(key, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+    def __getattr__(self, name: str):
+        if name == 'embedder':
+            raise AttributeError(name)
+        return getattr(self.embedder, name)
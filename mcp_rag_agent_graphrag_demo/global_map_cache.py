@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+'''全局搜索 map 阶段结果缓存
+
+GlobalSearch 每次查询都要对每一批社区报告调用一次 map 提示词。map 的输入只由
+（报告批次内容, 问题, 模型参数）决定：报告批次在 shuffle_data 时使用固定随机种子，
+同一份索引上同一问题得到的批次不变，报告内容变化时批次文本随之变化，缓存自然失效。
+因此可以按这几项的哈希缓存 map 输出，重复或规范化后相同的问题跳过大部分 map 调用。
+'''
+
+import hashlib
+import json
+
+from graphrag.query.structured_search.base import SearchResult
+from graphrag.query.structured_search.global_search.search import GlobalSearch
+
+from embedding_cache import SqliteLRUStore, normalize_text
+
+
+class CachedMapGlobalSearch(GlobalSearch):
+    '''map 阶段结果持久化缓存的 GlobalSearch，reduce 阶段照常执行'''
+
+    def __init__(self, *args, map_cache: SqliteLRUStore, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.map_cache = map_cache
+
+    def _map_key(self, context_data: str, query: str, args: tuple, kwargs: dict) -> str:
+        params = json.dumps([getattr(self.llm, 'model', ''), args, kwargs], sort_keys=True, default=str)
+        digest = hashlib.sha256()
+        for part in (params, normalize_text(query), context_data):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    async def _map_response_single_batch(self, context_data: str, query: str, *args, **kwargs) -> SearchResult:
+        key = self._map_key(context_data, query, args, kwargs)
+        cached = self.map_cache.get(key)
+        if cached is not None:
+            return SearchResult(
+                response=json.loads(cached),
+                context_data=context_data,
+                context_text=context_data,
+                completion_time=0,
+                llm_calls=0,
+                prompt_tokens=0
+            )
+        result = await super()._map_response_single_batch(context_data, query, *args, **kwargs)
+        # map 调用失败时 graphrag 返回空答案且分数为 0，这种结果不缓存
+        failed = all(not point.get('answer') and not point.get('score') for point in result.response)
+        if not failed:
+            self.map_cache.set(key, json.dumps(result.response, ensure_ascii=False).encode('utf-8'))
+        return result
+
+    async def aprecompute(self, queries: list[str]):
+        '''对常见问题预先跑一遍搜索，填充 map 缓存'''
+        for query in queries:
+            await self.asearch(query)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+'''全局搜索的社区报告预筛选
+
+在发出 map 请求之前，先用查询向量与社区报告向量（embed_community_reports 的结果）
+计算相关度，为每个问题选择最匹配的社区层级，只保留该层级中相关度靠前的报告。
+总结性的宽泛问题通常与粗粒度层级的报告更匹配，具体问题则落在细粒度层级，
+被剪掉的低相关报告不再占用 map 批次，单次全局搜索的 map 调用数随之减少。
+
+社区权重(occurrence weight)在构造时按每个层级的全部报告计算一次：GraphRAG 在构建上下文时
+只要第一份报告已带权重就不再计算，若按每次查询的子集计算，结果会依赖之前的查询，
+并发查询还会同时改写同一批报告对象。
+'''
+
+from collections.abc import AsyncGenerator, Callable
+
+import numpy as np
+
+from graphrag.model.community_report import CommunityReport
+from graphrag.model.entity import Entity
+from graphrag.query.context_builder.community_context import _compute_community_weights
+from graphrag.query.llm.base import BaseTextEmbedding
+from graphrag.query.structured_search.global_search.search import GlobalSearch, GlobalSearchResult
+
+
+class ReportSelector(object):
+    '''按层级组织的带向量社区报告，负责为查询选层并剪枝'''
+
+    def __init__(
+            self,
+            reports_by_level: dict[int, list[CommunityReport]],
+            max_reports: int = 30,
+            min_relative_score: float = 0.8,
+            rank_weight: float = 0.0,
+            entities: list[Entity] | None = None,
+            weight_attribute: str = 'occurrence weight',
+            normalize_weight: bool = True
+    ):
+        '''
+        :param reports_by_level: 每个层级对应 read_indexer_reports(..., level) 的结果，需带 full_content_embedding
+        :param max_reports: 每个问题最多保留的报告数
+        :param min_relative_score: 报告得分低于该层最高分的这个比例时被剪掉
+        :param rank_weight: 报告 rank（0-10）在得分中的权重，0 表示只看语义相关度
+        :param entities: 用于计算社区权重的实体，与 global_context_params 的 community_weight_name 对应
+        '''
+        self.max_reports = max_reports
+        self.min_relative_score = min_relative_score
+        self.rank_weight = rank_weight
+        self.levels = {}
+        for level, reports in reports_by_level.items():
+            if entities and reports:
+                _compute_community_weights(reports, entities, weight_attribute, normalize_weight)
+            reports = [r for r in reports if r.full_content_embedding is not None]
+            if not reports:
+                continue
+            matrix = np.vstack([np.asarray(r.full_content_embedding, dtype=np.float64) for r in reports])
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+            ranks = np.array([(r.rank or 0.0) / 10 for r in reports])
+            self.levels[level] = (reports, matrix, ranks)
+
+    def select(self, query_embedding: list[float]) -> tuple[int, list[CommunityReport]]:
+        '''返回 (选中的层级, 保留的报告)，层级取保留报告平均得分最高者，同分时取更粗的层级'''
+        query = np.asarray(query_embedding, dtype=np.float64)
+        query /= np.linalg.norm(query)
+        best = None
+        for level in sorted(self.levels):
+            reports, matrix, ranks = self.levels[level]
+            scores = matrix @ query + self.rank_weight * ranks
+            order = np.argsort(-scores)[:self.max_reports]
+            top = scores[order[0]]
+            kept = order[scores[order] >= top - (1 - self.min_relative_score) * abs(top)]
+            mean_score = float(scores[kept].mean())
+            if best is None or mean_score > best[0]:
+                best = (mean_score, level, [reports[i] for i in kept])
+        if best is None:
+            raise ValueError('没有带向量的社区报告，请先运行 embed_community_reports')
+        return best[1], best[2]
+
+
+class AdaptiveGlobalSearch(object):
+    '''先筛选报告再执行全局搜索，接口与 GlobalSearch 的 search/asearch/astream_search 一致'''
+
+    def __init__(
+            self,
+            selector: ReportSelector,
+            text_embedder: BaseTextEmbedding,
+            build_engine: Callable[[list[CommunityReport]], GlobalSearch]
+    ):
+        self.selector = selector
+        self.text_embedder = text_embedder
+        self.build_engine = build_engine
+
+    async def aselect(self, query: str) -> GlobalSearch:
+        _, reports = self.selector.select(await self.text_embedder.aembed(query))
+        return self.build_engine(reports)
+
+    def search(self, query: str, **kwargs) -> GlobalSearchResult:
+        _, reports = self.selector.select(self.text_embedder.embed(query))
+        return self.build_engine(reports).search(query, **kwargs)
+
+    async def asearch(self, query: str, **kwargs) -> GlobalSearchResult:
+        search_engine = await self.aselect(query)
+        return await search_engine.asearch(query, **kwargs)
+
+    async def astream_search(self, query: str, **kwargs) -> AsyncGenerator:
+        search_engine = await self.aselect(query)
+        async for chunk in search_engine.astream_search(query, **kwargs):
+            yield chunk
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+'''GraphRAG索引数据的共享加载器
+
+每张 create_final_* 表在进程内只读取一次，只读取查询适配器真正用到的列，
+由 indexer adapter 构建出的实体/关系/报告等对象也只构建一次，供各搜索模式共享。
+
+arrow_cache 模式下，parquet 首次读取时转存为未压缩的 Arrow IPC(Feather v2) 文件，
+之后以内存映射方式打开：同一主机上的多个工作进程共享同一份物理页，
+报告向量以只读 NumPy 视图的形式直接指向映射内存，不再展开成 Python 列表。
+'''
+
+import os
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from graphrag.query.indexer_adapters import (
+    read_indexer_entities,
+    read_indexer_communities,
+    read_indexer_reports,
+    read_indexer_text_units,
+    read_indexer_relationships,
+    # read_indexer_covariates,
+)
+from graphrag.vector_stores.lancedb import LanceDBVectorStore
+
+ENTITY_NODES_TABLE = 'create_final_nodes'
+ENTITY_EMBEDDING_TABLE = 'create_final_entities'
+COMMUNITIES_TABLE = 'create_final_communities'
+COMMUNITY_REPORT_TABLE = 'create_final_community_reports'
+TEXT_UNIT_TABLE = 'create_final_text_units'
+RELATIONSHIP_TABLE = 'create_final_relationships'
+# COVARIATE_TABLE = 'create_final_covariates'
+COMMUNITY_REPORT_EMBEDDING_TABLE = f'{COMMUNITY_REPORT_TABLE}_with_embeddings'
+
+ARROW_CACHE_DIR = '.arrow_cache'
+
+# 查询阶段用不到的列，读取时直接跳过，不做解码也不占内存
+# full_content_json 与 full_content 内容重复，是报告表中最大的一列
+UNUSED_COLUMNS = {
+    ENTITY_NODES_TABLE: ['x', 'y', 'graph_embedding'],
+    COMMUNITIES_TABLE: ['period'],
+    COMMUNITY_REPORT_TABLE: ['full_content_json', 'findings', 'rank_explanation', 'period'],
+    COMMUNITY_REPORT_EMBEDDING_TABLE: ['full_content_json', 'findings', 'rank_explanation', 'period'],
+}
+
+# 向量列，arrow_cache 模式下不转成 pandas，通过 embedding_matrix() 以矩阵视图访问
+EMBEDDING_COLUMNS = {
+    COMMUNITY_REPORT_EMBEDDING_TABLE: ['full_content_embeddings'],
+}
+
+
+def _projected_columns(path: str, table: str) -> list:
+    unused = UNUSED_COLUMNS.get(table, [])
+    return [name for name in pq.read_schema(path).names if name not in unused]
+
+
+def read_table(path: str, table: str) -> pd.DataFrame:
+    '''按列投影读取parquet表'''
+    return pd.read_parquet(path, columns=_projected_columns(path, table))
+
+
+def read_arrow_table(data_dir: str, table: str) -> pa.Table:
+    '''以内存映射方式读取表的 Arrow 缓存，缓存缺失或比 parquet 旧时先重建'''
+    parquet_path = f'{data_dir}/{table}.parquet'
+    cache_path = f'{data_dir}/{ARROW_CACHE_DIR}/{table}.arrow'
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(parquet_path):
+        data = pq.read_table(parquet_path, columns=_projected_columns(parquet_path, table)).combine_chunks()
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # 先写临时文件再替换，避免并发启动的其他进程读到写了一半的缓存
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        feather.write_feather(data, tmp_path, compression='uncompressed', chunksize=max(data.num_rows, 1))
+        os.replace(tmp_path, cache_path)
+        print(f'Arrow cache written to {cache_path}')
+    return feather.read_table(cache_path, memory_map=True)
+
+
+class IndexArtifacts(object):
+    '''一个索引目录下的全部查询数据，表和适配器对象均按需加载并缓存'''
+
+    def __init__(self, data_dir: str, community_level: int, arrow_cache: bool = False):
+        self.data_dir = data_dir
+        self.community_level = community_level
+        self.arrow_cache = arrow_cache
+        self._tables = {}
+        self._arrow_tables = {}
+
+    def arrow_table(self, name: str) -> pa.Table:
+        if name not in self._arrow_tables:
+            self._arrow_tables[name] = read_arrow_table(self.data_dir, name)
+        return self._arrow_tables[name]
+
+    def table(self, name: str) -> pd.DataFrame:
+        '''返回共享表的浅拷贝，调用方增删列不会影响其他使用者'''
+        if name not in self._tables:
+            if self.arrow_cache:
+                data = self.arrow_table(name)
+                embedding_columns = EMBEDDING_COLUMNS.get(name, [])
+                data = data.select([c for c in data.column_names if c not in embedding_columns])
+                self._tables[name] = data.to_pandas(split_blocks=True)
+            else:
+                self._tables[name] = read_table(f'{self.data_dir}/{name}.parquet', name)
+        return self._tables[name].copy(deep=False)
+
+    def embedding_matrix(self, name: str, column: str) -> tuple[list, np.ndarray]:
+        '''返回 (行id列表, 向量矩阵)，矩阵是映射内存上的只读零拷贝视图'''
+        data = self.arrow_table(name)
+        vectors = data.column(column).chunk(0) if data.num_rows else pa.array([], pa.list_(pa.float64()))
+        lengths = pc.unique(pc.list_value_length(vectors)).to_pylist()
+        if vectors.null_count or len(lengths) > 1:
+            raise ValueError(f"'{column}' in {name} must contain equal-length, non-null vectors")
+        dim = lengths[0] if lengths else 0
+        matrix = vectors.flatten().to_numpy(zero_copy_only=True).reshape(len(vectors), dim)
+        return data.column('id').to_pylist(), matrix
+
+    @cached_property
+    def entities(self):
+        return read_indexer_entities(
+            self.table(ENTITY_NODES_TABLE), self.table(ENTITY_EMBEDDING_TABLE), self.community_level
+        )
+
+    @cached_property
+    def relationships(self):
+        return read_indexer_relationships(self.table(RELATIONSHIP_TABLE))
+
+    @cached_property
+    def reports(self):
+        return read_indexer_reports(
+            self.table(COMMUNITY_REPORT_TABLE), self.table(ENTITY_NODES_TABLE), self.community_level
+        )
+
+    def report_levels(self) -> list[int]:
+        '''社区报告覆盖的全部层级'''
+        return sorted(int(level) for level in self.table(COMMUNITY_REPORT_TABLE)['level'].unique())
+
+    def embedded_reports(self, column: str = 'full_content_embeddings', community_level: int | None = None):
+        '''带向量的社区报告（DRIFT搜索、全局搜索预筛选使用），需先生成 COMMUNITY_REPORT_EMBEDDING_TABLE'''
+        name = COMMUNITY_REPORT_EMBEDDING_TABLE
+        reports = read_indexer_reports(
+            self.table(name),
+            self.table(ENTITY_NODES_TABLE),
+            self.community_level if community_level is None else community_level,
+            content_embedding_col=None if self.arrow_cache else column
+        )
+        if self.arrow_cache:
+            ids, matrix = self.embedding_matrix(name, column)
+            rows = {report_id: i for i, report_id in enumerate(ids)}
+            for report in reports:
+                report.full_content_embedding = matrix[rows[report.id]]
+        return reports
+
+    @cached_property
+    def communities(self):
+        return read_indexer_communities(
+            self.table(COMMUNITIES_TABLE), self.table(ENTITY_NODES_TABLE), self.table(COMMUNITY_REPORT_TABLE)
+        )
+
+    @cached_property
+    def text_units(self):
+        return read_indexer_text_units(self.table(TEXT_UNIT_TABLE))
+
+    # NOTE: covariates are turned off by default, because they generally need prompt tuning to be valuable
+    # Please see the GRAPHRAG_CLAIM_* settings
+    # @cached_property
+    # def covariates(self):
+    #     return {'claims': read_indexer_covariates(self.table(COVARIATE_TABLE))}
+
+    @cached_property
+    def description_embedding_store(self) -> LanceDBVectorStore:
+        # load description embeddings to an in-memory lancedb vectorstore
+        # to connect to a remote db, specify url and port values.
+        store = LanceDBVectorStore(
+            collection_name='default-entity-description',
+        )
+        store.connect(db_uri=f'{self.data_dir}/lancedb')
+        return store
+
+    def memory_report(self) -> dict:
+        '''已加载各表的常驻内存（字节）'''
+        return {
+            name: int(df.memory_usage(index=True, deep=True).sum())
+            for name, df in self._tables.items()
+        }
+
+    def mapped_report(self) -> dict:
+        '''arrow_cache 模式下各表映射的字节数，这部分由页缓存提供，多进程共享'''
+        return {name: data.nbytes for name, data in self._arrow_tables.items()}
+
+    def print_memory_report(self):
+        report = self.memory_report()
+        for name, size in report.items():
+            print(f'{name}: {len(self._tables[name])} rows, {size / 1024 / 1024:.2f} MB')
+        print(f'total: {sum(report.values()) / 1024 / 1024:.2f} MB')
+        mapped = self.mapped_report()
+        if mapped:
+            print(f'memory-mapped (shared): {sum(mapped.values()) / 1024 / 1024:.2f} MB')
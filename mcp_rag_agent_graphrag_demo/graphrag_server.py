@@ -3,21 +3,14 @@
 
 import asyncio
 import os
+import signal
+import sys
+import threading
 from collections.abc import AsyncGenerator
-from pathlib import Path
 
-import pandas as pd
 import tiktoken
 
 from graphrag.query.context_builder.entity_extraction import EntityVectorStoreKey
-from graphrag.query.indexer_adapters import (
-    read_indexer_entities,
-    read_indexer_communities,
-    read_indexer_reports,
-    read_indexer_text_units,
-    read_indexer_relationships,
-    # read_indexer_covariates,
-)
 from graphrag.query.llm.oai.chat_openai import ChatOpenAI
 from graphrag.query.llm.oai.embedding import OpenAIEmbedding
 from graphrag.query.llm.oai.typing import OpenaiApiType
@@ -29,19 +22,19 @@ from graphrag.query.structured_search.global_search.community_context import Glo
 from graphrag.query.structured_search.global_search.search import GlobalSearch, GlobalSearchResult
 from graphrag.query.structured_search.local_search.mixed_context import LocalSearchMixedContext
 from graphrag.query.structured_search.local_search.search import LocalSearch
-from graphrag.vector_stores.lancedb import LanceDBVectorStore
 from dotenv import load_dotenv
-import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp_common.server_runtime import AdmissionController, add_transport_arguments, run_server
+from graphrag_artifacts import COMMUNITY_REPORT_TABLE, IndexArtifacts
+from report_embeddings import aembed_community_reports
+from embedding_cache import CachedTextEmbedding, SqliteLRUStore
+from answer_cache import SemanticAnswerCache
+from global_map_cache import CachedMapGlobalSearch
+from global_report_filter import AdaptiveGlobalSearch, ReportSelector
 # 加载 .env 文件中的环境变量，使用绝对路径确保正确加载
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
 
-ENTITY_NODES_TABLE = 'create_final_nodes'
-ENTITY_EMBEDDING_TABLE = 'create_final_entities'
-COMMUNITIES_TABLE = 'create_final_communities'
-COMMUNITY_REPORT_TABLE = 'create_final_community_reports'
-TEXT_UNIT_TABLE = 'create_final_text_units'
-RELATIONSHIP_TABLE = 'create_final_relationships'
-# COVARIATE_TABLE = 'create_final_covariates'
 
 # community level in the Leiden community hierarchy from which we will load the community reports
 # higher value means we use reports from more fine-grained communities (at the cost of higher computation cost)
@@ -60,13 +53,26 @@ print("api_key----------:",api_key)
 print("api_base---------:",api_base)
 print("llm_model:-------:",llm_model)
 embedding_model = 'text-embedding-v2'
+# 社区报告批量向量化：每个请求的文本数和同时进行的请求数
+embedding_batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '16'))
+embedding_concurrency = int(os.getenv('EMBEDDING_CONCURRENCY', '4'))
 llm_temperature = 0.0
 json_mode = False
+# 全局搜索map阶段同时进行的LLM请求数
+global_concurrent_coroutines = int(os.getenv('GLOBAL_CONCURRENT_COROUTINES', '32'))
+# 设为1时全局搜索先按查询与社区报告向量的相关度选择层级并剪掉低相关报告，再执行map
+global_adaptive_search = os.getenv('GLOBAL_ADAPTIVE_SEARCH', '0') == '1'
+global_max_reports = int(os.getenv('GLOBAL_MAX_REPORTS', '30'))
+global_min_relative_score = float(os.getenv('GLOBAL_MIN_RELATIVE_SCORE', '0.8'))
 
 # 定义全局数据目录和LanceDB URI
 import os
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'doupocangqiong', 'output')
 LANCEDB_URI = f'{DATA_DIR}/lancedb'
+# 设为1时索引表通过内存映射的Arrow缓存加载，多个服务进程共享同一份物理内存
+ARROW_CACHE = os.getenv('GRAPHRAG_ARROW_CACHE', '0') == '1'
+# 服务启动时预先构建的搜索引擎，drift 首次构建需要向量化社区报告，默认不预热
+warm_engines = [name for name in os.getenv('GRAPHRAG_WARM_ENGINES', 'local,global').split(',') if name]
 
 # Ollama
 # api_key = ''
@@ -86,14 +92,43 @@ llm = ChatOpenAI(
     max_retries=20
 )
 
-text_embedder = OpenAIEmbedding(
-    api_key=api_key,
-    api_type=api_type,  # OpenaiApiType.OpenAI or OpenaiApiType.AzureOpenAI
-    api_base=api_base,  # http://localhost:11434/api for Ollama
-    api_version='2024-02-15-preview',  # just for AzureOpenAI
-    model=embedding_model,
-    deployment_name=embedding_model,  # just for AzureOpenAI
-    max_retries=20
+def new_text_embedder() -> OpenAIEmbedding:
+    return OpenAIEmbedding(
+        api_key=api_key,
+        api_type=api_type,  # OpenaiApiType.OpenAI or OpenaiApiType.AzureOpenAI
+        api_base=api_base,  # http://localhost:11434/api for Ollama
+        api_version='2024-02-15-preview',  # just for AzureOpenAI
+        model=embedding_model,
+        deployment_name=embedding_model,  # just for AzureOpenAI
+        max_retries=20
+    )
+
+
+text_embedder = new_text_embedder()
+
+# 用户查询的向量缓存，重复的问题不再请求embedding服务；社区报告的向量化仍直接使用 text_embedder
+QUERY_CACHE_DIR = os.path.join(os.path.dirname(DATA_DIR), 'query_cache')
+query_embedder = CachedTextEmbedding(
+    text_embedder,
+    SqliteLRUStore(
+        os.path.join(QUERY_CACHE_DIR, 'query_embeddings.sqlite'),
+        max_entries=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '10000'))
+    ),
+    model=embedding_model
+)
+
+# local_asearch 的语义回答缓存：相似问题直接返回已有回答，索引文件变化后自动失效
+answer_cache = SemanticAnswerCache(
+    os.path.join(QUERY_CACHE_DIR, 'local_answers.sqlite'),
+    DATA_DIR,
+    threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95')),
+    max_entries=int(os.getenv('ANSWER_CACHE_SIZE', '2000'))
+)
+
+# 全局搜索map阶段的结果缓存，重复的全局问题只重新执行reduce
+global_map_cache = SqliteLRUStore(
+    os.path.join(QUERY_CACHE_DIR, 'global_map.sqlite'),
+    max_entries=int(os.getenv('GLOBAL_MAP_CACHE_SIZE', '50000'))
 )
 
 token_encoder = tiktoken.get_encoding('cl100k_base')
@@ -159,69 +194,37 @@ reduce_llm_params = {
 }
 
 
-def build_local_context_builder() -> LocalSearchMixedContext:
-    entity_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_NODES_TABLE}.parquet')
-    entity_embedding_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet')
-
-    entities = read_indexer_entities(entity_df, entity_embedding_df, COMMUNITY_LEVEL)
-
-    # load description embeddings to an in-memory lancedb vectorstore
-    # to connect to a remote db, specify url and port values.
-    description_embedding_store = LanceDBVectorStore(
-        collection_name='default-entity-description',
-    )
-    description_embedding_store.connect(db_uri=LANCEDB_URI)
-
-    print(f'Entity count: {len(entity_df)}')
-    entity_df.head()
-
-    relationship_df = pd.read_parquet(f'{DATA_DIR}/{RELATIONSHIP_TABLE}.parquet')
-    relationships = read_indexer_relationships(relationship_df)
-    print(f'Relationship count: {len(relationship_df)}')
-    relationship_df.head()
-
-    # NOTE: covariates are turned off by default, because they generally need prompt tuning to be valuable
-    # Please see the GRAPHRAG_CLAIM_* settings
-    # covariate_df = pd.read_parquet(f'{DATA_DIR}/{COVARIATE_TABLE}.parquet')
-    # claims = read_indexer_covariates(covariate_df)
-    # logger.info(f'Claim records: {len(claims)}')
-    # covariates = {'claims': claims}
+def load_index_artifacts(data_dir: str = DATA_DIR) -> IndexArtifacts:
+    '''创建共享的索引数据加载器，各表和适配器对象首次使用时加载一次'''
+    return IndexArtifacts(data_dir, COMMUNITY_LEVEL, arrow_cache=ARROW_CACHE)
 
-    report_df = pd.read_parquet(f'{DATA_DIR}/{COMMUNITY_REPORT_TABLE}.parquet')
-    reports = read_indexer_reports(report_df, entity_df, COMMUNITY_LEVEL)
-    print(f'Report records: {len(report_df)}')
-    report_df.head()
-
-    text_unit_df = pd.read_parquet(f'{DATA_DIR}/{TEXT_UNIT_TABLE}.parquet')
-    text_units = read_indexer_text_units(text_unit_df)
-    print(f'Text unit records: {len(text_unit_df)}')
-    text_unit_df.head()
 
+def build_local_context_builder(artifacts: IndexArtifacts) -> LocalSearchMixedContext:
     context_builder = LocalSearchMixedContext(
-        community_reports=reports,
-        text_units=text_units,
-        entities=entities,
-        relationships=relationships,
+        community_reports=artifacts.reports,
+        text_units=artifacts.text_units,
+        entities=artifacts.entities,
+        relationships=artifacts.relationships,
 
         # if you did not run covariates during indexing, set this to None
         # covariates=covariates,
 
-        entity_text_embeddings=description_embedding_store,
+        entity_text_embeddings=artifacts.description_embedding_store,
 
         # if the vectorstore uses entity title as ids, set this to EntityVectorStoreKey.TITLE
         embedding_vectorstore_key=EntityVectorStoreKey.ID,
 
-        text_embedder=text_embedder,
+        text_embedder=query_embedder,
         token_encoder=token_encoder
     )
 
     return context_builder
 
 
-def build_local_search_engine() -> LocalSearch:
+def build_local_search_engine(artifacts: IndexArtifacts) -> LocalSearch:
     return LocalSearch(
         llm=llm,
-        context_builder=build_local_context_builder(),
+        context_builder=build_local_context_builder(artifacts),
         token_encoder=token_encoder,
         llm_params=llm_params,
         context_builder_params=local_context_params,
@@ -232,40 +235,28 @@ def build_local_search_engine() -> LocalSearch:
     )
 
 
-def build_local_question_gen() -> LocalQuestionGen:
+def build_local_question_gen(artifacts: IndexArtifacts) -> LocalQuestionGen:
     return LocalQuestionGen(
         llm=llm,
-        context_builder=build_local_context_builder(),
+        context_builder=build_local_context_builder(artifacts),
         token_encoder=token_encoder,
         llm_params=llm_params,
         context_builder_params=local_context_params
     )
 
 
-def build_global_search_engine() -> GlobalSearch:
-    community_df = pd.read_parquet(f'{DATA_DIR}/{COMMUNITIES_TABLE}.parquet')
-    entity_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_NODES_TABLE}.parquet')
-    report_df = pd.read_parquet(f'{DATA_DIR}/{COMMUNITY_REPORT_TABLE}.parquet')
-    entity_embedding_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet')
-
-    communities = read_indexer_communities(community_df, entity_df, report_df)
-    reports = read_indexer_reports(report_df, entity_df, COMMUNITY_LEVEL)
-    entities = read_indexer_entities(entity_df, entity_embedding_df, COMMUNITY_LEVEL)
-    print(f'Total report count: {len(report_df)}')
-    print(f'Report count after filtering by community level {COMMUNITY_LEVEL}: {len(reports)}')
-    report_df.head()
-
+def build_global_search_engine(artifacts: IndexArtifacts, reports: list | None = None) -> GlobalSearch:
     context_builder = GlobalCommunityContext(
-        community_reports=reports,
-        communities=communities,
+        community_reports=artifacts.reports if reports is None else reports,
+        communities=artifacts.communities,
 
         # default to None if you don't want to use community weights for ranking
-        entities=entities,
+        entities=artifacts.entities,
 
         token_encoder=token_encoder
     )
 
-    return GlobalSearch(
+    return CachedMapGlobalSearch(
         llm=llm,
         context_builder=context_builder,
         token_encoder=token_encoder,
@@ -286,89 +277,76 @@ def build_global_search_engine() -> GlobalSearch:
         json_mode=json_mode,
 
         context_builder_params=global_context_params,
-        concurrent_coroutines=32,
+        concurrent_coroutines=global_concurrent_coroutines,
 
         # free form text describing the response type and format, can be anything,
         # e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
-        response_type='multiple paragraphs'
+        response_type='multiple paragraphs',
+
+        map_cache=global_map_cache
     )
 
 
-def embed_community_reports(
+def build_adaptive_global_search_engine(artifacts: IndexArtifacts) -> AdaptiveGlobalSearch:
+    selector = ReportSelector(
+        {
+            level: artifacts.embedded_reports('full_content_embeddings', community_level=level)
+            for level in artifacts.report_levels()
+        },
+        max_reports=global_max_reports,
+        min_relative_score=global_min_relative_score,
+        entities=artifacts.entities,
+        weight_attribute=global_context_params['community_weight_name'],
+        normalize_weight=global_context_params['normalize_community_weight']
+    )
+    return AdaptiveGlobalSearch(
+        selector,
+        query_embedder,
+        lambda reports: build_global_search_engine(artifacts, reports)
+    )
+
+
+async def aembed_reports(
         input_dir: str,
-        embedder: OpenAIEmbedding,
+        embedder: OpenAIEmbedding = text_embedder,
         community_report_table: str = COMMUNITY_REPORT_TABLE
 ):
-    '''Embeds the full content of the community reports and saves the DataFrame with embeddings to the output path.'''
-    input_path = Path(input_dir) / f'{community_report_table}.parquet'
-    output_path = Path(input_dir) / f'{community_report_table}_with_embeddings.parquet'
-
-    if not Path(output_path).exists():
-        print('Embedding file not found. Computing community report embeddings...')
-
-        report_df = pd.read_parquet(input_path)
-
-        if 'full_content' not in report_df.columns:
-            error_msg = f"'full_content' column not found in {input_path}"
-            raise ValueError(error_msg)
-
-        report_df['full_content_embeddings'] = report_df.loc[:, 'full_content'].apply(
-            lambda x: embedder.embed(x)
-        )
-
-        # Save the DataFrame with embeddings to the output path
-        report_df.to_parquet(output_path)
-        print(f'Embeddings saved to {output_path}')
-        return report_df
-    print(f'Embeddings file already exists at {output_path}')
-    return pd.read_parquet(output_path)
-
-
-def build_drift_search_engine() -> DRIFTSearch:
-    # read nodes table to get community and degree data
-    entity_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_NODES_TABLE}.parquet')
-    entity_embedding_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet')
-
-    entities = read_indexer_entities(entity_df, entity_embedding_df, COMMUNITY_LEVEL)
-
-    # load description embeddings to an in-memory lancedb vectorstore
-    # to connect to a remote db, specify url and port values.
-    description_embedding_store = LanceDBVectorStore(
-        collection_name='default-entity-description',
+    '''Embeds the full content of the community reports and saves the DataFrame with embeddings to the output path.
+
+    服务运行时在服务的事件循环中执行，与查询向量化共用 text_embedder 的连接池，不阻塞其他请求
+    '''
+    return await aembed_community_reports(
+        input_dir,
+        embedder,
+        community_report_table,
+        batch_size=embedding_batch_size,
+        concurrency=embedding_concurrency
     )
-    description_embedding_store.connect(db_uri=LANCEDB_URI)
-
-    print(f'Entity count: {len(entity_df)}')
-    entity_df.head()
 
-    relationship_df = pd.read_parquet(f'{DATA_DIR}/{RELATIONSHIP_TABLE}.parquet')
-    relationships = read_indexer_relationships(relationship_df)
 
-    print(f'Relationship count: {len(relationship_df)}')
-    relationship_df.head()
+def embed_community_reports(
+        input_dir: str,
+        embedder: OpenAIEmbedding | None = None,
+        community_report_table: str = COMMUNITY_REPORT_TABLE
+):
+    '''同步版本，供启动预热和测试模式使用，不能在事件循环中调用
 
-    text_unit_df = pd.read_parquet(f'{DATA_DIR}/{TEXT_UNIT_TABLE}.parquet')
-    text_units = read_indexer_text_units(text_unit_df)
+    在临时的事件循环中执行，默认使用单独创建的客户端，text_embedder 的连接池不会绑定到这个事件循环
+    '''
+    return asyncio.run(aembed_reports(input_dir, embedder or new_text_embedder(), community_report_table))
 
-    print(f'Text unit records: {len(text_unit_df)}')
-    text_unit_df.head()
 
-    report_df = embed_community_reports(DATA_DIR, text_embedder)
-    reports = read_indexer_reports(
-        report_df,
-        entity_df,
-        COMMUNITY_LEVEL,
-        content_embedding_col='full_content_embeddings'
-    )
+def build_drift_search_engine(artifacts: IndexArtifacts) -> DRIFTSearch:
+    reports = artifacts.embedded_reports('full_content_embeddings')
 
     context_builder = DRIFTSearchContextBuilder(
         chat_llm=llm,
-        text_embedder=text_embedder,
-        entities=entities,
-        relationships=relationships,
+        text_embedder=query_embedder,
+        entities=artifacts.entities,
+        relationships=artifacts.relationships,
         reports=reports,
-        entity_text_embeddings=description_embedding_store,
-        text_units=text_units
+        entity_text_embeddings=artifacts.description_embedding_store,
+        text_units=artifacts.text_units
     )
 
     return DRIFTSearch(
@@ -378,52 +356,195 @@ def build_drift_search_engine() -> DRIFTSearch:
     )
 
 
+class SearchEngineRegistry(object):
+    '''进程级搜索引擎注册表
+
+    索引数据在首次使用时加载一次，Local/Global/DRIFT搜索和问题生成共享同一份数据；
+    各引擎按需构建后常驻内存，DATA_DIR 下的索引更新后调用 reload() 重新加载。
+    DRIFT 和自适应全局搜索需要社区报告向量，首次构建前先补齐向量化。
+    '''
+
+    builders = {
+        'local': build_local_search_engine,
+        'global': build_adaptive_global_search_engine if global_adaptive_search else build_global_search_engine,
+        'drift': build_drift_search_engine,
+        'question_gen': build_local_question_gen,
+    }
+    report_embedding_engines = {'drift'} | ({'global'} if global_adaptive_search else set())
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+        self._artifacts = None
+        self._engines = {}
+        self._reports_embedded = False
+        self._lock = threading.RLock()
+        self._embed_lock = asyncio.Lock()
+
+    @property
+    def artifacts(self) -> IndexArtifacts:
+        with self._lock:
+            if self._artifacts is None:
+                self._artifacts = load_index_artifacts(self.data_dir)
+            return self._artifacts
+
+    def get(self, name: str):
+        if name not in self.builders:
+            raise ValueError(f'未知的搜索模式: {name}, 可选: {list(self.builders)}')
+        with self._lock:
+            if name not in self._engines:
+                if name in self.report_embedding_engines and not self._reports_embedded:
+                    embed_community_reports(self.data_dir)
+                    self._reports_embedded = True
+                self._engines[name] = self.builders[name](self.artifacts)
+            return self._engines[name]
+
+    async def aget(self, name: str):
+        '''异步工具中使用：社区报告的向量化在服务的事件循环中执行，
+        读取parquet、构建适配器和连接LanceDB放到线程中，不阻塞其他请求'''
+        if name in self._engines:
+            return self._engines[name]
+        if name in self.report_embedding_engines:
+            async with self._embed_lock:
+                if not self._reports_embedded:
+                    await aembed_reports(self.data_dir)
+                    self._reports_embedded = True
+        return await asyncio.to_thread(self.get, name)
+
+    def warm_up(self, names=('local', 'global')):
+        '''预先构建常用引擎，避免首个请求承担加载开销'''
+        for name in names:
+            self.get(name)
+        self.artifacts.print_memory_report()
+
+    def reload(self, data_dir: str | None = None):
+        '''丢弃已加载的索引数据和引擎，下次访问时从磁盘重新构建'''
+        with self._lock:
+            if data_dir is not None:
+                self.data_dir = data_dir
+            self._artifacts = None
+            self._reports_embedded = False
+            self._engines.clear()
+            answer_cache.set_data_dir(self.data_dir)
+        print(f'搜索引擎已重置, 索引目录: {self.data_dir}')
+
+
+engine_registry = SearchEngineRegistry()
+
+
+def reload_search_engines(data_dir: str | None = None):
+    engine_registry.reload(data_dir)
+
+
+def install_reload_signal():
+    '''服务运行中收到 SIGHUP 时重新加载索引(kill -HUP <pid>)，Windows 没有该信号'''
+    if not hasattr(signal, 'SIGHUP'):
+        return
+    # 放到线程中执行，等待正在构建的引擎释放锁时不阻塞事件循环
+    signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=reload_search_engines, daemon=True).start())
+
+
+def cache_stats() -> dict:
+    '''各查询缓存的命中/未命中计数'''
+    return {
+        'query_embedding': query_embedder.stats(),
+        'local_answer': answer_cache.stats(),
+        'global_map': global_map_cache.stats(),
+    }
+
+
 def local_search(query) -> SearchResult:
-    search_engine = build_local_search_engine()
+    search_engine = engine_registry.get('local')
     return search_engine.search(query)
 
 import asyncio
 from typing import Any
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 import httpx
 import json
 #创建一个对象
 mcp = FastMCP("graphrag")
+# 同时执行的搜索数上限与排队上限；global/drift搜索一次会发出大量LLM请求，默认上限较小
+admission = AdmissionController(
+    int(os.getenv("GRAPHRAG_MAX_CONCURRENCY", "4")),
+    int(os.getenv("GRAPHRAG_MAX_QUEUE", "16"))
+)
 
 @mcp.tool()
+@admission.guard
 async def local_asearch(query) -> str:
     """为斗破苍穹小说提供相关的知识补充"""
-    search_engine = build_local_search_engine()
+    version = answer_cache.version()
+    query_embedding = await query_embedder.aembed(query)
+    cached = answer_cache.lookup(query_embedding)
+    if cached is not None:
+        return cached
+    search_engine = await engine_registry.aget('local')
     result = await search_engine.asearch(query)
     print("search_result:", type(result.response),result.response)
+    answer_cache.add(query, query_embedding, result.response, version)
     return result.response
 
 
 async def local_astream_search(query) -> AsyncGenerator:
-    search_engine = build_local_search_engine()
+    search_engine = await engine_registry.aget('local')
     async for chunk in search_engine.astream_search(query):
         yield chunk
 
 
 def global_search(query) -> GlobalSearchResult:
-    search_engine = build_global_search_engine()
+    search_engine = engine_registry.get('global')
     return search_engine.search(query)
 
 
-async def global_asearch(query) -> GlobalSearchResult:
-    search_engine = build_global_search_engine()
-    return await search_engine.asearch(query)
+@mcp.tool()
+@admission.guard
+async def global_asearch(query: str) -> str:
+    """基于斗破苍穹全书社区报告回答总结性问题，如主要主题、势力格局、人物关系全貌"""
+    search_engine = await engine_registry.aget('global')
+    result = await search_engine.asearch(query)
+    return result.response
 
 
 async def global_astream_search(query) -> AsyncGenerator:
-    search_engine = build_global_search_engine()
+    search_engine = await engine_registry.aget('global')
     async for chunk in search_engine.astream_search(query):
         yield chunk
 
 
-async def drift_asearch(query) -> SearchResult:
-    search_engine = build_drift_search_engine()
-    return await search_engine.asearch(query)
+@mcp.tool()
+@admission.guard
+async def drift_asearch(query: str) -> str:
+    """结合社区报告与局部实体信息回答斗破苍穹中需要多步推理的复杂问题"""
+    search_engine = await engine_registry.aget('drift')
+    result = await search_engine.asearch(query)
+    if isinstance(result.response, str):
+        return result.response
+    return json.dumps(result.response, ensure_ascii=False, default=str)
+
+
+async def _stream_with_progress(stream: AsyncGenerator, ctx: Context) -> str:
+    '''把流式搜索的文本片段通过MCP进度通知逐段发送给客户端，最后返回完整回答'''
+    response = ''
+    async for chunk in stream:
+        # 流的第一个元素是上下文数据，之后才是回答文本
+        if isinstance(chunk, str):
+            response += chunk
+            await ctx.report_progress(len(response), message=chunk)
+    return response
+
+
+@mcp.tool()
+@admission.guard
+async def local_stream_asearch(query: str, ctx: Context) -> str:
+    """为斗破苍穹小说提供相关的知识补充，回答以进度通知的形式逐段返回"""
+    return await _stream_with_progress(local_astream_search(query), ctx)
+
+
+@mcp.tool()
+@admission.guard
+async def global_stream_asearch(query: str, ctx: Context) -> str:
+    """基于斗破苍穹全书社区报告回答总结性问题，回答以进度通知的形式逐段返回"""
+    return await _stream_with_progress(global_astream_search(query), ctx)
 
 
 def local_search_demo():
@@ -435,9 +556,7 @@ def local_search_demo():
 
 async def local_asearch_demo():
     query = 'Who is Scrooge, and what are his main relationships?'
-    result = await local_asearch(query)
-    print(result.context_data)
-    print(result.response)
+    print(await local_asearch(query))
 
 
 async def local_astream_search_demo():
@@ -457,7 +576,7 @@ async def question_generation_demo():
         'Tell me about Agent Mercer',
         'What happens in Dulce military base?'
     ]
-    question_generator = build_local_question_gen()
+    question_generator = await engine_registry.aget('question_gen')
     candidate_questions = await question_generator.agenerate(
         question_history=question_history, context_data=None, question_count=5
     )
@@ -473,9 +592,7 @@ def global_search_demo():
 
 async def global_asearch_demo():
     query = 'What are the top themes in this story?'
-    result = await global_asearch(query)
-    print(result.context_data)
-    print(result.response)
+    print(await global_asearch(query))
 
 
 async def global_astream_search_demo():
@@ -492,9 +609,7 @@ async def global_astream_search_demo():
 
 async def drift_asearch_demo():
     query = 'Who is agent Mercer?'
-    result = await local_asearch(query)
-    print(result.context_data)
-    print(result.response)
+    print(await drift_asearch(query))
 
 
 import argparse
@@ -518,6 +633,13 @@ if __name__ == '__main__':
     4. 客户端连接服务器:
         python graphrag_client.py graphrag_server.py
 
+    5. 以网络服务运行，预热一次后多个客户端共享:
+        python graphrag_server.py --transport streamable-http --port 8002 --max-concurrency 4
+        python graphrag_client.py http://127.0.0.1:8002/mcp
+
+    6. 索引更新后通知运行中的服务重新加载(非Windows):
+        kill -HUP <服务进程号>
+
 两种模式的区别:
     - server模式: 启动MCP服务器，等待客户端连接，用于与其他系统集成
     - test模式: 直接执行查询并显示结果，用于快速测试功能
@@ -527,6 +649,7 @@ if __name__ == '__main__':
                       help='运行模式：server(启动服务器)或test(运行测试)')
     parser.add_argument('--query', type=str, default='萧炎的女性朋友有那些?',
                       help='测试模式下的查询语句')
+    add_transport_arguments(parser, default_port=8002, admission=admission)
     
     args = parser.parse_args()
     
@@ -534,7 +657,10 @@ if __name__ == '__main__':
         '''启动MCP服务器，用于与客户端联调'''
         print("启动GraphRAG MCP服务器...")
         print("使用 'python graphrag_client.py graphrag_server.py' 命令连接客户端")
-        mcp.run(transport="stdio")
+        # 启动前预加载索引数据和常用引擎，工具调用时不再重复读取parquet
+        engine_registry.warm_up(warm_engines)
+        install_reload_signal()
+        run_server(mcp, args, admission)
     else:
         '''运行测试模式，直接执行本地搜索'''
         print(f"运行GraphRAG测试查询: {args.query}")
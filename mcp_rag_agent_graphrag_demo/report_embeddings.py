@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+'''社区报告 full_content 的批量向量化
+
+报告按 token 上限切块后，多个块合并成一个请求发送，请求之间以有限并发异步执行，
+失败的批次指数退避重试。每完成一轮就把进度写入 *_with_embeddings.parquet，
+中断后重新运行只会补齐尚未向量化的报告。GraphRAG 重新建索引后，按 full_content
+的哈希复用未变化报告的向量，只对新增或修改过的报告重新向量化。
+读取parquet、计算哈希、切块和写检查点都放在线程中执行，在MCP服务的事件循环中运行时不阻塞其他请求。
+
+向量化只依赖 embedder.async_client.embeddings.create，可以把 --api-base 指向本地的
+假 embedding 服务来验证整个流程，例如:
+    python report_embeddings.py --api-base http://127.0.0.1:8000/v1 --batch-size 4
+'''
+
+import asyncio
+import hashlib
+import os
+import random
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from graphrag.query.llm.oai.embedding import OpenAIEmbedding
+
+from graphrag_artifacts import COMMUNITY_REPORT_TABLE
+
+EMBEDDING_COLUMN = 'full_content_embeddings'
+HASH_COLUMN = 'full_content_hash'
+
+
+def content_hash(text: str, model: str) -> str:
+    '''向量的缓存键，模型变化时所有报告都会重新向量化'''
+    return hashlib.sha256(f'{model}\n{text}'.encode('utf-8')).hexdigest()
+
+
+def _split_tokens(text: str, embedder: OpenAIEmbedding) -> list[tuple[str, int]]:
+    '''按 embedder 的 token 上限切块，返回 (块文本, token数)'''
+    tokens = embedder.token_encoder.encode(text)
+    size = embedder.max_tokens
+    return [
+        (embedder.token_encoder.decode(tokens[i:i + size]), len(tokens[i:i + size]))
+        for i in range(0, max(len(tokens), 1), size)
+    ]
+
+
+async def _embed_batch(embedder: OpenAIEmbedding, batch: list[str], max_retries: int) -> list[list[float]]:
+    for attempt in range(max_retries + 1):
+        try:
+            response = await embedder.async_client.embeddings.create(input=batch, model=embedder.model)
+            # 按 index 排序，保证返回顺序与输入一致
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as err:
+            if attempt == max_retries:
+                raise
+            delay = min(2 ** attempt, 30) + random.random()
+            print(f'Embedding batch failed ({err}), retry {attempt + 1}/{max_retries} in {delay:.1f}s')
+            await asyncio.sleep(delay)
+
+
+def _split_texts(texts: list[str], embedder: OpenAIEmbedding) -> tuple[list[str], list[int], list[int]]:
+    '''所有文本切块，返回 (块文本, 所属文本的序号, 块的token数) 三个列表'''
+    pieces, owners, weights = [], [], []
+    for i, text in enumerate(texts):
+        for chunk, n_tokens in _split_tokens(text, embedder):
+            pieces.append(chunk)
+            owners.append(i)
+            weights.append(n_tokens)
+    return pieces, owners, weights
+
+
+async def aembed_texts(
+        embedder: OpenAIEmbedding,
+        texts: list[str],
+        batch_size: int = 16,
+        concurrency: int = 4,
+        max_retries: int = 5
+) -> list[list[float]]:
+    '''批量向量化，长文本按块的 token 数加权平均后归一化（与 OpenAIEmbedding.embed 一致）'''
+    pieces, owners, weights = await asyncio.to_thread(_split_texts, texts, embedder)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(start: int) -> list[list[float]]:
+        async with semaphore:
+            return await _embed_batch(embedder, pieces[start:start + batch_size], max_retries)
+
+    batches = await asyncio.gather(*[run(start) for start in range(0, len(pieces), batch_size)])
+    vectors = [vector for batch in batches for vector in batch]
+
+    grouped = [[] for _ in texts]
+    for owner, vector, weight in zip(owners, vectors, weights):
+        grouped[owner].append((vector, weight))
+    results = []
+    for chunks in grouped:
+        average = np.average([v for v, _ in chunks], axis=0, weights=[max(w, 1) for _, w in chunks])
+        results.append((average / np.linalg.norm(average)).tolist())
+    return results
+
+
+def _write_checkpoint(report_df: pd.DataFrame, output_path: Path):
+    tmp_path = output_path.with_name(f'{output_path.name}.{os.getpid()}.tmp')
+    report_df.to_parquet(tmp_path)
+    os.replace(tmp_path, output_path)
+
+
+def _load_reports(input_path: Path, output_path: Path, model: str) -> tuple[pd.DataFrame, int]:
+    '''读取社区报告并按内容哈希带上已有的向量，返回 (报告表, 被清除的向量数)'''
+    report_df = pd.read_parquet(input_path)
+    if 'full_content' not in report_df.columns:
+        error_msg = f"'full_content' column not found in {input_path}"
+        raise ValueError(error_msg)
+
+    # 以内容哈希为键复用已有向量：内容未变的报告即使社区编号变化也不重新向量化，
+    # 不再存在的社区不会写回输出文件，其向量随之清除
+    report_df[HASH_COLUMN] = [content_hash(text, model) for text in report_df['full_content']]
+    done, removed = {}, 0
+    if output_path.exists():
+        previous = pd.read_parquet(output_path)
+        if HASH_COLUMN not in previous.columns:
+            previous[HASH_COLUMN] = [content_hash(text, model) for text in previous['full_content']]
+        done = {
+            key: vector for key, vector in zip(previous[HASH_COLUMN], previous[EMBEDDING_COLUMN])
+            if vector is not None
+        }
+        removed = len(set(done) - set(report_df[HASH_COLUMN]))
+        if removed:
+            print(f'Dropping {removed} embeddings of changed or removed community reports')
+    report_df[EMBEDDING_COLUMN] = pd.Series(
+        [done.get(key) for key in report_df[HASH_COLUMN]], index=report_df.index, dtype=object
+    )
+    return report_df, removed
+
+
+async def aembed_community_reports(
+        input_dir: str,
+        embedder: OpenAIEmbedding,
+        community_report_table: str = COMMUNITY_REPORT_TABLE,
+        batch_size: int = 16,
+        concurrency: int = 4,
+        checkpoint_every: int = 128,
+        max_retries: int = 5
+) -> pd.DataFrame:
+    '''向量化社区报告并写入 *_with_embeddings.parquet，只处理内容有变化或新增的报告'''
+    input_path = Path(input_dir) / f'{community_report_table}.parquet'
+    output_path = Path(input_dir) / f'{community_report_table}_with_embeddings.parquet'
+
+    report_df, removed = await asyncio.to_thread(_load_reports, input_path, output_path, embedder.model)
+
+    pending = report_df.index[report_df[EMBEDDING_COLUMN].isna()].tolist()
+    if not pending:
+        # 报告的其他列（如排名、社区编号）可能随重建索引变化，输出文件过期时整体改写
+        if removed or output_path.stat().st_mtime < input_path.stat().st_mtime:
+            await asyncio.to_thread(_write_checkpoint, report_df, output_path)
+        print(f'Embeddings are up to date at {output_path}')
+        return report_df
+    print(f'Embedding {len(pending)} of {len(report_df)} community reports...')
+
+    for start in range(0, len(pending), checkpoint_every):
+        rows = pending[start:start + checkpoint_every]
+        vectors = await aembed_texts(
+            embedder,
+            report_df.loc[rows, 'full_content'].tolist(),
+            batch_size=batch_size,
+            concurrency=concurrency,
+            max_retries=max_retries
+        )
+        for row, vector in zip(rows, vectors):
+            report_df.at[row, EMBEDDING_COLUMN] = vector
+        await asyncio.to_thread(_write_checkpoint, report_df, output_path)
+        print(f'Embedded {min(start + checkpoint_every, len(pending))}/{len(pending)} reports')
+
+    print(f'Embeddings saved to {output_path}')
+    return report_df
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from graphrag.query.llm.oai.typing import OpenaiApiType
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+    parser = argparse.ArgumentParser(description='社区报告批量向量化')
+    parser.add_argument('--data-dir', type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'doupocangqiong', 'output'))
+    parser.add_argument('--api-base', type=str, default=os.getenv('BASE_URL'),
+                        help='embedding服务地址，可指向本地假服务用于测试')
+    parser.add_argument('--model', type=str, default='text-embedding-v2')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--checkpoint-every', type=int, default=128)
+    args = parser.parse_args()
+
+    embedder = OpenAIEmbedding(
+        api_key=os.getenv('API_KEY', 'EMPTY'),
+        api_type=OpenaiApiType.OpenAI,
+        api_base=args.api_base,
+        model=args.model,
+        deployment_name=args.model,
+        max_retries=0
+    )
+    asyncio.run(aembed_community_reports(
+        args.data_dir,
+        embedder,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        checkpoint_every=args.checkpoint_every
+    ))
@@ -0,0 +1,84 @@
+# -*- encoding: utf-8 -*-
+
+"""
+RAGSystem.query 的单次查询框架开销基准
+
+用固定返回的假检索器和假LLM替换向量库与大模型，只测量问答链本身(构建、提示词拼装、
+结果整理)的耗时，对比"每次查询重新构建链"和"复用链"两种方式，用于发现这条热路径上的回归。
+
+用法:
+    python bench_query_overhead.py --iterations 2000
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListLLM
+from langchain_core.retrievers import BaseRetriever
+
+from rag_context import ContextPacker
+from rag_system import RAGSystem
+
+
+class FixedRetriever(BaseRetriever):
+    docs: list
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        return self.docs
+
+
+def make_rag(top_k=5, chunk_chars=500):
+    """不加载模型和向量库的 RAGSystem，只保留问答链需要的属性"""
+    rag = RAGSystem.__new__(RAGSystem)
+    rag.config = {"top_k": top_k}
+    rag.llm = FakeListLLM(responses=["萧炎的父亲是萧战。"])
+    rag.retriver = FixedRetriever(docs=[
+        Document(page_content="斗" * chunk_chars, metadata={"source": "doupocangqiong.txt"})
+        for _ in range(top_k)
+    ])
+    rag.qa_chain = rag._build_qa_chain()
+    rag.tokenizer = None
+    rag.context_packer = ContextPacker(3000, length_function=rag.count_tokens)
+    rag.retrieval_executor = ThreadPoolExecutor(max_workers=1)
+    return rag
+
+
+def bench(name, fn, iterations):
+    fn()  # 预热
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24}{elapsed / iterations * 1e6:10.1f} us/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rag = make_rag(top_k=args.top_k)
+    question = "萧炎的父亲是谁?"
+
+    def rebuild_each_query():
+        # 与 RAGSystem.query 走同一条路径(检索 -> 按预算拼装上下文 -> stuff链)，只是每次重新构建链
+        chain = rag._build_qa_chain()
+        docs = rag._retrieve(question)
+        result = chain.combine_documents_chain.invoke({"input_documents": docs, "question": question})
+        rag._format_result(result["output_text"], docs)
+
+    bench("rebuild chain", rebuild_each_query, args.iterations)
+    bench("query (reused chain)", lambda: rag.query(question), args.iterations)
+
+    loop = asyncio.new_event_loop()
+    bench("aquery (reused chain)", lambda: loop.run_until_complete(rag.aquery(question)), args.iterations)
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
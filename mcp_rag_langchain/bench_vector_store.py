@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Chroma 与进程内IVF索引(rag_ann_store.py)的 recall@k / 延迟对比
+
+以Chroma中fp32向量的精确top-k为基准，分别测量Chroma(HNSW + SQLite)查询和
+不同 nprobe 下IVF索引查询的召回率与单次查询延迟。
+没有指定查询文件时，用随机文档块向量加噪声后的向量作为查询，不需要加载向量化模型。
+
+用法:
+    python rag_ann_store.py import
+    python bench_vector_store.py --k 5 --samples 200 --nprobe 1 2 4 8 16 32
+    python bench_vector_store.py --queries questions.txt   # 用真实问题(fp32模型向量化)
+"""
+
+import argparse
+import os
+import time
+
+import chromadb
+import numpy as np
+
+from rag_ann_store import AnnVectorStore
+from rag_system import config
+
+
+def make_queries(args, matrix):
+    if args.queries:
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+        with open(args.queries, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        embedder = HuggingFaceEmbeddings(
+            model_name=os.getenv("EMBED_MODEL_PATH", "e:/github_project/models/bge-large-zh-v1.5"),
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+        return np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(matrix), size=min(args.samples, len(matrix)), replace=False)
+    queries = matrix[picks] + rng.normal(scale=args.noise, size=(len(picks), matrix.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def report(name, ids, truth, elapsed, k):
+    recall = np.mean([len(set(found[:k]) & set(expected)) / k for found, expected in zip(ids, truth)])
+    print(f"{name:<20} recall@{k}: {recall:.4f}  {elapsed * 1000:8.2f} ms/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.02, help="合成查询时加到文档向量上的噪声标准差")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=str, default=None, help="每行一个问题的文本文件")
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=config["persist_dir"]).get_collection(config["collection_name"])
+    data = collection.get(include=["embeddings"])
+    matrix = np.asarray(data["embeddings"], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    queries = make_queries(args, matrix)
+
+    # 精确检索的结果作为基准
+    truth = [[data["ids"][i] for i in np.argsort(-scores)[:args.k]] for scores in queries @ matrix.T]
+    print(f"文档块数: {len(matrix)}, 查询数: {len(queries)}")
+
+    start = time.perf_counter()
+    found = [collection.query(query_embeddings=[q.tolist()], n_results=args.k, include=["distances"])["ids"][0] for q in queries]
+    report("chroma", found, truth, (time.perf_counter() - start) / len(queries), args.k)
+
+    store = AnnVectorStore(config["ann_dir"], embedding=None)
+    print(f"IVF簇数: {len(store.centroids)}")
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        found = [[store.ids[row] for row in store.search_vector(q, args.k, nprobe)[0]] for q in queries]
+        report(f"ivf nprobe={nprobe}", found, truth, (time.perf_counter() - start) / len(queries), args.k)
+
+
+if __name__ == "__main__":
+    main()
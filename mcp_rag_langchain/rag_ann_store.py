@@ -0,0 +1,202 @@
+# -*- encoding: utf-8 -*-
+
+"""
+进程内的近似最近邻(ANN)向量库，作为Chroma之外的只读检索后端
+
+1.向量归一化后以float16保存为.npy文件，查询时内存映射(mmap)读取，不经过SQLite
+2.IVF倒排索引：球面k-means把向量分成 nlist 个簇，向量按簇连续存放，
+  查询时只扫描与查询向量最接近的 nprobe 个簇，nprobe 越大召回率越高、延迟越高
+3.知识库仍由 rag_ingest.py 写入Chroma，再用本模块的 import 命令导出为ANN索引
+
+用法:
+    python rag_ann_store.py import                # 从Chroma集合导出到 config["ann_dir"]
+    python rag_ann_store.py import --nlist 256
+    # 启用: VECTOR_BACKEND=ann，召回率/延迟对比见 bench_vector_store.py
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from rag_mmr import mmr_select
+
+VECTORS_NAME = "vectors.f16.npy"
+IVF_NAME = "ivf.npz"
+DOCS_NAME = "docs.json"
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _assign(vectors, centroids, batch_size=8192):
+    """每个向量所属的簇(内积最大的中心)，分批计算以限制内存"""
+    return np.concatenate([
+        np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), batch_size)
+    ])
+
+
+def train_ivf(vectors, nlist, iterations=20, sample=20000, seed=0):
+    """球面k-means训练簇中心，返回归一化的中心矩阵"""
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), size=sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+        # 空簇用随机向量重新初始化
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+def import_from_chroma(persist_dir, collection_name, output_dir, nlist=None, batch_size=1000):
+    """把Chroma集合中的向量、文档块和元数据导出为ANN索引，返回导出的文档块数"""
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=persist_dir).get_collection(collection_name)
+    total = collection.count()
+    if not total:
+        raise ValueError("向量库为空，请先运行 rag_ingest.py")
+    ids, documents, metadatas, vectors = [], [], [], []
+    for offset in range(0, total, batch_size):
+        data = collection.get(offset=offset, limit=batch_size, include=["embeddings", "documents", "metadatas"])
+        ids.extend(data["ids"])
+        documents.extend(data["documents"])
+        metadatas.extend(metadata or {} for metadata in data["metadatas"])
+        vectors.append(np.asarray(data["embeddings"], dtype=np.float32))
+    vectors = _normalize(np.vstack(vectors))
+
+    nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+    centroids = train_ivf(vectors, nlist)
+    assignments = _assign(vectors, centroids)
+    # 按簇排序后连续存放，每个簇对应 offsets[i]:offsets[i+1] 这一段行
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))])
+
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    matrix = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, VECTORS_NAME), mode="w+", dtype=np.float16, shape=vectors.shape
+    )
+    matrix[:] = vectors[order]
+    matrix.flush()
+    del matrix
+    np.savez(os.path.join(tmp_dir, IVF_NAME), centroids=centroids, offsets=offsets)
+    with open(os.path.join(tmp_dir, DOCS_NAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "collection_name": collection_name,
+            "ids": [ids[i] for i in order],
+            "documents": [documents[i] for i in order],
+            "metadatas": [metadatas[i] for i in order],
+        }, f, ensure_ascii=False)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return len(ids)
+
+
+class AnnVectorStore(VectorStore):
+    """只读的IVF向量库，实现检索器需要的相似度检索和MMR检索接口"""
+
+    def __init__(self, path, embedding, nprobe=8):
+        self.path = path
+        self._embedding = embedding
+        self.nprobe = nprobe
+        self.vectors = np.load(os.path.join(path, VECTORS_NAME), mmap_mode="r")
+        ivf = np.load(os.path.join(path, IVF_NAME))
+        self.centroids = ivf["centroids"]
+        self.offsets = ivf["offsets"]
+        with open(os.path.join(path, DOCS_NAME), "r", encoding="utf-8") as f:
+            docs = json.load(f)
+        self.ids = docs["ids"]
+        self.documents = docs["documents"]
+        self.metadatas = docs["metadatas"]
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def search_vector(self, query_vector, k, nprobe=None):
+        """返回内积(余弦相似度)最高的k个 (行号数组, 得分数组)"""
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+        scores = np.concatenate([
+            self.vectors[self.offsets[i]:self.offsets[i + 1]].astype(np.float32) @ query for i in lists
+        ])
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return rows[order], scores[order]
+
+    def _document(self, row):
+        return Document(page_content=self.documents[row], metadata=self.metadatas[row], id=self.ids[row])
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        rows, scores = self.search_vector(embedding, k, kwargs.get("nprobe"))
+        return [(self._document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def candidates_by_vector(self, embedding, fetch_k, nprobe=None):
+        """MMR的候选: (文档块列表, 候选向量矩阵)"""
+        rows, _ = self.search_vector(embedding, fetch_k, nprobe)
+        # 按行号顺序读取内存映射的向量，访问更连续
+        rows = np.sort(rows)
+        return [self._document(row) for row in rows], self.vectors[rows].astype(np.float32)
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        docs, vectors = self.candidates_by_vector(embedding, fetch_k, kwargs.get("nprobe"))
+        return [docs[i] for i in mmr_select(embedding, vectors, k, lambda_mult)]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, **kwargs
+        )
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("AnnVectorStore 是只读的，请写入Chroma后运行 python rag_ann_store.py import")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("请使用 import_from_chroma 从Chroma集合构建 AnnVectorStore")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from rag_system import config
+
+    parser = argparse.ArgumentParser(description='进程内IVF向量库')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='从Chroma集合导出向量和文档块')
+    import_parser.add_argument('--output', default=config["ann_dir"])
+    import_parser.add_argument('--nlist', type=int, default=None, help='簇的个数，默认4*sqrt(N)')
+    args = parser.parse_args()
+
+    count = import_from_chroma(config["persist_dir"], config["collection_name"], args.output, nlist=args.nlist)
+    print(f"已导出到: {args.output}, 文档块数为:{count}")
@@ -0,0 +1,209 @@
+# -*- encoding: utf-8 -*-
+
+"""
+BM25关键词检索与混合检索
+
+1.中文按连续汉字的二元组(bigram)切词，英文和数字按单词切分，不依赖分词词典，
+  人名、地名等专有名词(如"萧炎")能直接命中
+2.倒排索引保存在向量库目录下的SQLite文件中，由 rag_ingest.py 在写入向量时同步维护
+3.HybridRetriever 同时查询向量检索和BM25，用倒数排名融合(RRF)合并两路结果
+
+用法:
+    python rag_bm25.py --rebuild              # 从已有的Chroma集合重建倒排索引
+    python rag_bm25.py --query "萧炎的父亲是谁"  # 只用BM25检索，查看命中的文档块
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+BM25_INDEX_NAME = "bm25.sqlite"
+
+_TOKEN_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[a-z0-9]+")
+_CJK_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def tokenize(text):
+    """汉字串切成二元组(单字串保留单字)，其余按小写的字母数字串切分"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class BM25Index(object):
+    """持久化的BM25倒排索引，线程安全"""
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, length INTEGER, content TEXT, metadata TEXT)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS postings (term TEXT, id TEXT, tf INTEGER, PRIMARY KEY (term, id)) WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS postings_id ON postings (id)')
+        self._conn.commit()
+        self._stats = None
+
+    def _corpus_stats(self):
+        """文档数和平均长度；data_version 变化说明其他进程(如 rag_ingest.py)改写过索引"""
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if self._stats is None or self._stats[0] != version:
+            count, avg_length = self._conn.execute('SELECT COUNT(*), AVG(length) FROM docs').fetchone()
+            self._stats = (version, count, avg_length or 0.0)
+        return self._stats[1:]
+
+    def __len__(self):
+        with self._lock:
+            return self._corpus_stats()[0]
+
+    def _delete(self, ids):
+        self._conn.executemany('DELETE FROM postings WHERE id = ?', [(i,) for i in ids])
+        self._conn.executemany('DELETE FROM docs WHERE id = ?', [(i,) for i in ids])
+
+    def add(self, ids, docs):
+        """写入(或覆盖)文档块"""
+        with self._lock:
+            self._delete(ids)
+            for item_id, doc in zip(ids, docs):
+                counts = Counter(tokenize(doc.page_content))
+                self._conn.execute(
+                    'INSERT INTO docs (id, length, content, metadata) VALUES (?, ?, ?, ?)',
+                    (item_id, sum(counts.values()), doc.page_content, json.dumps(doc.metadata or {}, ensure_ascii=False))
+                )
+                self._conn.executemany(
+                    'INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)',
+                    [(term, item_id, tf) for term, tf in counts.items()]
+                )
+            self._conn.commit()
+            self._stats = None
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete(ids)
+            self._conn.commit()
+            self._stats = None
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM postings')
+            self._conn.execute('DELETE FROM docs')
+            self._conn.commit()
+            self._stats = None
+
+    def search(self, query, k=5):
+        """返回BM25得分最高的k个 (文档块, 得分)"""
+        terms = Counter(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            count, avg_length = self._corpus_stats()
+            if not count:
+                return []
+            placeholders = ','.join('?' * len(terms))
+            rows = self._conn.execute(
+                f'SELECT p.term, p.id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.id '
+                f'WHERE p.term IN ({placeholders})',
+                list(terms)
+            ).fetchall()
+
+            postings = {}
+            for term, item_id, tf, length in rows:
+                postings.setdefault(term, []).append((item_id, tf, length))
+            scores = Counter()
+            for term, entries in postings.items():
+                idf = math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5))
+                for item_id, tf, length in entries:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[item_id] += terms[term] * idf * tf * (self.k1 + 1) / norm
+            top = scores.most_common(k)
+            if not top:
+                return []
+
+            placeholders = ','.join('?' * len(top))
+            docs = {
+                item_id: Document(page_content=content, metadata=json.loads(metadata), id=item_id)
+                for item_id, content, metadata in self._conn.execute(
+                    f'SELECT id, content, metadata FROM docs WHERE id IN ({placeholders})',
+                    [item_id for item_id, _ in top]
+                )
+            }
+        return [(docs[item_id], score) for item_id, score in top]
+
+    def rebuild_from_collection(self, collection, batch_size=1000):
+        """从Chroma集合全量重建索引，返回写入的文档块数"""
+        self.clear()
+        total = collection.count()
+        for offset in range(0, total, batch_size):
+            data = collection.get(offset=offset, limit=batch_size, include=["documents", "metadatas"])
+            self.add(data["ids"], [
+                Document(page_content=content or "", metadata=metadata or {})
+                for content, metadata in zip(data["documents"], data["metadatas"])
+            ])
+        return total
+
+
+class HybridRetriever(BaseRetriever):
+    """向量检索和BM25并行查询，按倒数排名融合(RRF)后返回前k个文档块"""
+
+    vector_retriever: BaseRetriever
+    index: Any
+    executor: Any
+    k: int = 5
+    lexical_k: int = 10
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        lexical = self.executor.submit(self.index.search, query, self.lexical_k)
+        vector_docs = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        lexical_docs = [doc for doc, _ in lexical.result()]
+
+        scores, docs = Counter(), {}
+        for ranked in (vector_docs, lexical_docs):
+            for rank, doc in enumerate(ranked):
+                # 两路结果的文档块id不一定都有，按内容合并
+                key = doc.page_content
+                docs.setdefault(key, doc)
+                scores[key] += 1 / (self.rrf_k + rank + 1)
+        return [docs[key] for key, _ in scores.most_common(self.k)]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from rag_system import config
+
+    parser = argparse.ArgumentParser(description='BM25倒排索引')
+    parser.add_argument('--rebuild', action='store_true', help='从Chroma集合重建倒排索引')
+    parser.add_argument('--query', type=str, default=None, help='用BM25检索并打印结果')
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    index = BM25Index(os.path.join(config["persist_dir"], BM25_INDEX_NAME))
+    if args.rebuild:
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=config["persist_dir"]).get_collection(config["collection_name"])
+        print(f"已重建倒排索引, 文档块数为:{index.rebuild_from_collection(collection)}")
+    if args.query:
+        for doc, score in index.search(args.query, args.k):
+            print(f"{score:.3f} | {doc.metadata.get('source', 'unknown')} | {doc.page_content[:80]}")
@@ -0,0 +1,83 @@
+# -*- encoding: utf-8 -*-
+
+"""
+按token预算拼装问答上下文
+
+检索结果按排名依次放入上下文，直到用满 context_tokens:
+1.相邻文档块切块时有重叠(chunk_overlap)，与已放入的块重叠的部分去掉，完全被包含的块直接跳过
+2.放不下整块时在句子边界截断，只保留能放下的完整句子
+这样每次发给LLM的提示词长度可控，也不再为重叠部分重复付费
+"""
+
+import re
+
+from langchain_core.documents import Document
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;…\n])")
+
+
+def split_sentences(text):
+    return [sentence for sentence in _SENTENCE_END.split(text) if sentence]
+
+
+def overlap_length(left, right, min_overlap=8, max_overlap=400):
+    """left 的后缀与 right 的前缀相同的最大长度，小于 min_overlap 视为不重叠"""
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextPacker(object):
+    """把排好序的文档块装进token预算内，length_function 为计算token数的函数"""
+
+    def __init__(self, budget, length_function=len, min_overlap=8, max_overlap=400):
+        self.budget = budget
+        self.length_function = length_function
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+
+    def _strip_overlap(self, text, source, packed):
+        """去掉与同一来源已放入文档块重叠的部分，完全重复时返回空串"""
+        for doc in packed:
+            if doc.metadata.get("source") != source:
+                continue
+            if text in doc.page_content:
+                return ""
+            head = overlap_length(doc.page_content, text, self.min_overlap, self.max_overlap)
+            if head:
+                text = text[head:]
+            tail = overlap_length(text, doc.page_content, self.min_overlap, self.max_overlap)
+            if tail:
+                text = text[:-tail]
+        return text
+
+    def _trim(self, text, budget):
+        """在句子边界截断到不超过 budget 个token"""
+        kept, used = [], 0
+        for sentence in split_sentences(text):
+            size = self.length_function(sentence)
+            if used + size > budget:
+                break
+            kept.append(sentence)
+            used += size
+        return "".join(kept)
+
+    def pack(self, docs):
+        """按排名顺序返回装入预算的文档块(内容可能被去重或截断，元数据不变)"""
+        packed, used = [], 0
+        for doc in docs:
+            text = self._strip_overlap(doc.page_content, doc.metadata.get("source"), packed).strip()
+            if not text:
+                continue
+            size = self.length_function(text)
+            if used + size > self.budget:
+                text = self._trim(text, self.budget - used).strip()
+                if not text:
+                    break
+                size = self.length_function(text)
+            packed.append(Document(page_content=text, metadata=doc.metadata, id=doc.id))
+            used += size
+            if used >= self.budget:
+                break
+        return packed
@@ -0,0 +1,259 @@
+# -*- encoding: utf-8 -*-
+
+"""
+知识库导入流水线，与MCP服务启动分离
+
+1.按文件内容哈希记录导入清单(manifest)，内容未变的文件直接跳过
+2.文件内容或切块参数变化时，先删除该文件旧的文档块，再重新切块、向量化
+3.文档块id由(来源文件, 块序号, 块内容)确定，重复导入同一内容只会覆盖，不会产生重复向量
+4.加载->切块->分批->向量化->写库 全程流式：文档块按块数和字符数组成批次，
+  由多个向量化工作进程并行计算（每个进程固定torch线程数，避免相互争抢CPU），结果批量写入Chroma
+5.写入Chroma的同时维护BM25倒排索引(rag_bm25.py)，两者的文档块id一致
+
+用法:
+    python rag_ingest.py                      # 导入默认的斗破苍穹文本
+    python rag_ingest.py a.txt b.pdf --prune  # 导入指定文件，并删除清单中不再存在的文件
+    python rag_ingest.py --rebuild            # 清空集合后全量重建（清理旧版本启动时重复写入的向量）
+    python rag_ingest.py --workers 4          # 4个进程并行向量化
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+MANIFEST_NAME = "ingest_manifest.json"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source, index, content):
+    """确定性的文档块id"""
+    return hashlib.sha1(f"{source}\0{index}\0{content}".encode("utf-8")).hexdigest()
+
+
+class IngestManifest(object):
+    """记录每个已导入文件的内容哈希、切块参数和文档块id"""
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.files, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _chunk_params(rag):
+    params = {
+        "chunk_size": rag.config.get("chunk_size", 500),
+        "chunk_overlap": rag.config.get("chunk_overlap", 50),
+    }
+    # 按token切块时tokenizer也是切块参数，更换后需要重新切块
+    if rag.config.get("tokenizer_path"):
+        params["tokenizer"] = rag.config["tokenizer_path"]
+    return params
+
+
+def iter_batches(items, max_items, max_chars):
+    """把(id, 文档块)流按块数和总字符数分批，长度相近的块因此批次大小也相近"""
+    batch, chars = [], 0
+    for item in items:
+        batch.append(item)
+        chars += len(item[1].page_content)
+        if len(batch) >= max_items or chars >= max_chars:
+            yield batch
+            batch, chars = [], 0
+    if batch:
+        yield batch
+
+
+_worker_model = None
+
+
+def _init_worker(model_path, threads):
+    """工作进程初始化：固定torch线程数并加载一次向量模型"""
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_path, device="cpu")
+
+
+def _embed_texts(texts):
+    # 与 RAGSystem 中 HuggingFaceEmbeddings(encode_kwargs={'normalize_embeddings': True}) 的结果一致
+    return _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True).tolist()
+
+
+class EmbeddingPool(object):
+    """
+    向量化工作进程池；workers为0时在当前进程内计算。
+    文档向量始终用fp32模型(EMBED_MODEL_PATH)计算，与查询时使用的向量化后端无关：
+    ONNX后端的模型目录只有tokenizer和.onnx文件，且int8向量不应混入fp32的集合
+    """
+
+    def __init__(self, rag, workers=0, threads_per_worker=None):
+        from rag_system import build_fp32_embedding, embed_model_path
+
+        self.workers = workers
+        self.executor = None
+        self.embedding = None
+        if workers > 0:
+            threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(embed_model_path(), threads)
+            )
+        else:
+            # 查询后端本身就是fp32模型时直接复用，不再加载第二份
+            is_fp32 = rag.config.get("embedding_backend") != "onnx"
+            self.embedding = rag.embedding if is_fp32 else build_fp32_embedding()
+
+    def embed(self, batches):
+        """按输入顺序产出 (批次, 向量列表)，同时在途的批次数受限，保持流式内存占用"""
+        if self.executor is None:
+            for batch in batches:
+                yield batch, self.embedding.embed_documents([doc.page_content for _, doc in batch])
+            return
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, self.executor.submit(_embed_texts, [doc.page_content for _, doc in batch])))
+            if len(pending) >= self.workers * 2:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def _write_batch(rag, batch, vectors):
+    """预先算好的向量直接批量写入Chroma，不再经过 embedding_function；同时写入BM25倒排索引"""
+    ids = [item_id for item_id, _ in batch]
+    rag.vectorstore._collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=[doc.page_content for _, doc in batch],
+        metadatas=[doc.metadata or None for _, doc in batch]
+    )
+    rag.open_lexical_index().add(ids, [doc for _, doc in batch])
+
+
+def _delete_chunks(rag, ids):
+    rag.vectorstore.delete(ids=ids)
+    rag.open_lexical_index().delete(ids)
+
+
+def ingest_files(rag, file_paths, prune=False, workers=None):
+    """增量导入文件到 rag 的向量库，返回新写入的文档块数"""
+    manifest = IngestManifest(os.path.join(rag.config["persist_dir"], MANIFEST_NAME))
+    params = _chunk_params(rag)
+    sources = [os.path.abspath(path) for path in file_paths]
+    workers = rag.config.get("embed_workers", 0) if workers is None else workers
+    pool = EmbeddingPool(rag, workers)
+    written = 0
+    start_time = time.time()
+
+    try:
+        for source in sources:
+            sha256 = file_sha256(source)
+            entry = manifest.files.get(source)
+            if entry and entry["sha256"] == sha256 and entry["params"] == params:
+                print(f"未变化，跳过: {source}")
+                continue
+
+            if entry and entry["chunk_ids"]:
+                _delete_chunks(rag, entry["chunk_ids"])
+
+            chunks = (
+                (chunk_id(source, i, chunk.page_content), chunk)
+                for i, chunk in enumerate(rag._iter_chunks(source))
+            )
+            batches = iter_batches(
+                chunks,
+                rag.config.get("embed_batch_size", 64),
+                rag.config.get("embed_batch_chars", 24000)
+            )
+            ids = []
+            for batch, vectors in pool.embed(batches):
+                _write_batch(rag, batch, vectors)
+                ids.extend(item_id for item_id, _ in batch)
+                written += len(batch)
+                print(f"已写入 {written} 个文档块, {written / (time.time() - start_time):.1f} chunks/s")
+            manifest.files[source] = {
+                "sha256": sha256,
+                "params": params,
+                "chunk_ids": ids,
+                "ingested_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            # 每个文件完成后立即保存清单，中断后重跑可以从下一个文件继续
+            manifest.save()
+            print(f"已导入: {source}, 文档块数为:{len(ids)}")
+    finally:
+        pool.close()
+
+    if prune:
+        for source in [s for s in manifest.files if s not in sources]:
+            if manifest.files[source]["chunk_ids"]:
+                _delete_chunks(rag, manifest.files[source]["chunk_ids"])
+            del manifest.files[source]
+            print(f"已删除: {source}")
+        manifest.save()
+
+    elapsed = time.time() - start_time
+    print(f"知识库构建完成,新写入文档块数为:{written}, 耗时{elapsed:.1f}s, {written / max(elapsed, 1e-9):.1f} chunks/s")
+    return written
+
+
+def rebuild(rag, file_paths, workers=None):
+    """清空集合和清单后全量导入"""
+    rag.vectorstore.delete_collection()
+    rag.open_lexical_index().clear()
+    manifest_path = os.path.join(rag.config["persist_dir"], MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    rag.reset_vectorstore()
+    return ingest_files(rag, file_paths, workers=workers)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from rag_system import RAGSystem, config
+
+    parser = argparse.ArgumentParser(description='RAG知识库增量导入')
+    parser.add_argument('files', nargs='*',
+                        default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'rag_db', 'doupocangqiong.txt')],
+                        help='要导入的pdf/txt文件')
+    parser.add_argument('--prune', action='store_true', help='删除清单中存在但本次未指定的文件')
+    parser.add_argument('--rebuild', action='store_true', help='清空集合后全量重建')
+    parser.add_argument('--workers', type=int, default=None, help='向量化工作进程数，默认取config中的embed_workers')
+    args = parser.parse_args()
+
+    # 导入只需要向量库，不加载重排序模型；文档向量始终用fp32模型计算并写入Chroma，作为各查询后端的基准
+    rag = RAGSystem(dict(config, rerank_model_path="", embedding_backend="huggingface", vector_backend="chroma"))
+    if args.rebuild:
+        rebuild(rag, args.files, workers=args.workers)
+    else:
+        ingest_files(rag, args.files, prune=args.prune, workers=args.workers)
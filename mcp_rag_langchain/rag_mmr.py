@@ -0,0 +1,127 @@
+# -*- encoding: utf-8 -*-
+
+"""
+向量化的最大边际相关性(MMR)选择
+
+1.候选向量之间的相似度矩阵只计算一次，贪心选择的每一步只做数组运算：
+  维护每个候选与已选集合的最大相似度，选中一个候选后与该行逐元素取最大值即可更新
+2.batch_mmr_select 一次处理多个查询(候选数不同时用掩码补齐)
+3.MMRRetriever 替代 as_retriever(search_type="mmr")，Chroma和进程内IVF向量库都可以使用
+"""
+
+from typing import Any
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def batch_mmr_select(queries, candidates, k, lambda_mult=0.5, valid=None):
+    """
+    :param queries: (B, D) 查询向量
+    :param candidates: (B, N, D) 每个查询的候选向量
+    :param valid: (B, N) 候选是否有效，候选数不足N的查询用False补齐
+    :return: (B, k) 按选择顺序排列的候选下标，有效候选不足k个时补-1
+    """
+    queries = _normalize(np.asarray(queries, dtype=np.float32))
+    candidates = _normalize(np.asarray(candidates, dtype=np.float32))
+    batch, n = candidates.shape[:2]
+    valid = np.ones((batch, n), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+    k = min(k, n)
+
+    relevance = np.einsum("bnd,bd->bn", candidates, queries)
+    similarity = candidates @ candidates.transpose(0, 2, 1)
+    rows = np.arange(batch)
+    selected = np.full((batch, k), -1, dtype=np.int64)
+    available = valid.copy()
+    max_similarity = np.full((batch, n), -np.inf, dtype=np.float32)
+
+    for step in range(k):
+        if step == 0:
+            # 第一个总是选与查询最相关的候选
+            scores = relevance.copy()
+        else:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = np.argmax(scores, axis=1)
+        has_candidate = available[rows, best]
+        selected[has_candidate, step] = best[has_candidate]
+        available[rows[has_candidate], best[has_candidate]] = False
+        max_similarity[has_candidate] = np.maximum(
+            max_similarity[has_candidate], similarity[rows[has_candidate], best[has_candidate]]
+        )
+    return selected
+
+
+def mmr_select(query, candidates, k, lambda_mult=0.5):
+    """单个查询的MMR选择，返回按选择顺序排列的候选下标列表"""
+    candidates = np.asarray(candidates, dtype=np.float32)
+    if not len(candidates):
+        return []
+    selected = batch_mmr_select(np.asarray(query)[None], candidates[None], k, lambda_mult)[0]
+    return [int(i) for i in selected if i >= 0]
+
+
+def fetch_candidates(vectorstore, embeddings, fetch_k):
+    """每个查询向量取回fetch_k个最相似的 (文档块列表, 候选向量矩阵)"""
+    if hasattr(vectorstore, "candidates_by_vector"):
+        return [vectorstore.candidates_by_vector(embedding, fetch_k) for embedding in embeddings]
+    # Chroma: 一次查询同时取回多个查询的候选和候选向量
+    results = vectorstore._collection.query(
+        query_embeddings=[list(embedding) for embedding in embeddings],
+        n_results=fetch_k,
+        include=["embeddings", "documents", "metadatas"]
+    )
+    return [
+        (
+            [
+                Document(page_content=content, metadata=metadata or {}, id=item_id)
+                for item_id, content, metadata in zip(ids, documents, metadatas)
+            ],
+            np.asarray(vectors, dtype=np.float32)
+        )
+        for ids, documents, metadatas, vectors in zip(
+            results["ids"], results["documents"], results["metadatas"], results["embeddings"]
+        )
+    ]
+
+
+class MMRRetriever(BaseRetriever):
+    """取回fetch_k个候选后用向量化的MMR选出k个，兼顾相关性与多样性"""
+
+    vectorstore: Any
+    k: int = 5
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    def retrieve_batch(self, queries):
+        """批量检索：查询一次性向量化，MMR选择也一次完成"""
+        embeddings = self.vectorstore.embeddings.embed_documents(list(queries))
+        candidates = fetch_candidates(self.vectorstore, embeddings, self.fetch_k)
+        width = max((len(docs) for docs, _ in candidates), default=0)
+        if not width:
+            return [[] for _ in queries]
+
+        dim = len(embeddings[0])
+        padded = np.zeros((len(candidates), width, dim), dtype=np.float32)
+        valid = np.zeros((len(candidates), width), dtype=bool)
+        for i, (docs, vectors) in enumerate(candidates):
+            if docs:
+                padded[i, :len(docs)] = vectors
+                valid[i, :len(docs)] = True
+        selected = batch_mmr_select(embeddings, padded, self.k, self.lambda_mult, valid)
+        return [
+            [docs[j] for j in row if j >= 0]
+            for (docs, _), row in zip(candidates, selected)
+        ]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        docs, vectors = fetch_candidates(self.vectorstore, [embedding], self.fetch_k)[0]
+        return [docs[i] for i in mmr_select(embedding, vectors, self.k, self.lambda_mult)]
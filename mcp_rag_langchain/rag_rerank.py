@@ -0,0 +1,163 @@
+# -*- encoding: utf-8 -*-
+
+"""
+交叉编码器(bge-reranker-large)重排序
+
+1.检索阶段多取一些候选(rerank_fetch_k)，由交叉编码器逐对打分后只保留 top_k，
+  小 k 下的精度更高，发给LLM的上下文随之变少
+2.候选按长度排序后分桶成批，每批只填充到本批最长的句子对，减少填充带来的无效计算
+3.(查询, 文档块)的得分放在LRU缓存中，重复或相近的查询不再重复打分
+4.单次重排序有时间预算，超出预算时停止打分：已打分的候选按得分排序，未打分的按向量检索原本的顺序排在其后
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+
+class CrossEncoderReranker(object):
+    """CPU上批量推理的交叉编码器打分器，线程安全"""
+
+    def __init__(self, model_path, batch_size=16, max_length=512, cache_size=4096, threads=None):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            model_path,
+            local_files_only=True,
+            low_cpu_mem_usage=True
+        )
+        self.model.eval()
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 模型推理本身已用满torch线程，多个查询同时打分只会互相争抢CPU
+        self._model_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        # 每个句子对的推理耗时(秒)的滑动平均，用来按剩余预算确定批大小
+        self._pair_seconds = None
+
+    @staticmethod
+    def _key(query, text):
+        return hashlib.sha1(f"{query}\0{text}".encode("utf-8")).hexdigest()
+
+    def _cached(self, key):
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key, score):
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _acquire_model(self, deadline):
+        """等待模型锁，超过 deadline 仍未拿到时返回 False"""
+        if deadline is None:
+            return self._model_lock.acquire()
+        remaining = deadline - time.monotonic()
+        return remaining > 0 and self._model_lock.acquire(timeout=remaining)
+
+    def _score_batch(self, query, texts, deadline=None):
+        """对一批句子对打分；等待模型锁超过 deadline 时返回 None"""
+        if not self._acquire_model(deadline):
+            return None
+        try:
+            started = time.monotonic()
+            with self.torch.no_grad():
+                inputs = self.tokenizer(
+                    [query] * len(texts),
+                    texts,
+                    padding=True,
+                    truncation="only_second",
+                    max_length=self.max_length,
+                    return_tensors="pt"
+                )
+                scores = self.model(**inputs).logits.view(-1).float().tolist()
+            pair_seconds = (time.monotonic() - started) / len(texts)
+            self._pair_seconds = pair_seconds if self._pair_seconds is None else 0.8 * self._pair_seconds + 0.2 * pair_seconds
+            return scores
+        finally:
+            self._model_lock.release()
+
+    def _next_batch_size(self, deadline):
+        """按剩余预算和每个句子对的平均耗时缩小批大小，让一批在预算内跑完"""
+        if deadline is None or self._pair_seconds is None:
+            return self.batch_size
+        remaining = deadline - time.monotonic()
+        return max(1, min(self.batch_size, int(remaining / self._pair_seconds)))
+
+    def score(self, query, texts, deadline=None):
+        """返回每个文本的相关度得分；超过 deadline(time.monotonic()) 时停止打分，未打分的文本得分为 None"""
+        keys = [self._key(query, text) for text in texts]
+        scores = [self._cached(key) for key in keys]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        self.hits += len(texts) - len(pending)
+        self.misses += len(pending)
+
+        # 按长度分桶：长度相近的句子对放在同一批，填充长度接近每个句子对的真实长度
+        pending.sort(key=lambda i: len(texts[i]))
+        position = 0
+        while position < len(pending):
+            batch = pending[position:position + self._next_batch_size(deadline)]
+            # 预算在等待模型锁时检查：并发查询排队等锁的时间也计入预算
+            batch_scores = self._score_batch(query, [texts[i] for i in batch], deadline)
+            if batch_scores is None:
+                self.timeouts += 1
+                break
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+                self._store(keys[i], score)
+            position += len(batch)
+            # 已开始的批次会跑完，跑完后若已超出预算，不再开始下一批
+            if deadline is not None and time.monotonic() > deadline and position < len(pending):
+                self.timeouts += 1
+                break
+        return scores
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "timeouts": self.timeouts,
+            "size": len(self._cache),
+        }
+
+
+class RerankRetriever(BaseRetriever):
+    """包装一个多取候选的检索器，重排序后返回前 top_k 个文档块"""
+
+    base_retriever: BaseRetriever
+    reranker: Any
+    top_k: int = 5
+    budget_ms: float = 0
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        docs = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        if len(docs) <= 1:
+            return docs
+        deadline = time.monotonic() + self.budget_ms / 1000 if self.budget_ms > 0 else None
+        scores = self.reranker.score(query, [doc.page_content for doc in docs], deadline=deadline)
+        # 超出时间预算时部分候选没有得分：已打分的按得分排序，未打分的保持向量检索的顺序排在其后
+        scored = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: scores[i], reverse=True)
+        unscored = [i for i, score in enumerate(scores) if score is None]
+        return [docs[i] for i in (scored + unscored)[:self.top_k]]
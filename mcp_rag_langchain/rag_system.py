@@ -0,0 +1,258 @@
+# -*- encoding: utf-8 -*-
+
+"""
+RAG系统：向量库、检索器与问答链的封装
+知识库的构建见 rag_ingest.py，MCP服务见 rag_server.py
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import Chroma
+from langchain_openai import ChatOpenAI
+# from langchain_community.chains import RetrievalQA
+from langchain_classic.chains import RetrievalQA
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+import os
+from dotenv import load_dotenv
+
+from rag_ann_store import AnnVectorStore
+from rag_bm25 import BM25_INDEX_NAME, BM25Index, HybridRetriever
+from rag_context import ContextPacker
+from rag_ingest import ingest_files
+from rag_mmr import MMRRetriever
+from rag_onnx_embedding import OnnxEmbeddings
+from rag_rerank import CrossEncoderReranker, RerankRetriever
+
+load_dotenv()
+
+def embed_model_path():
+    """fp32向量模型的本地路径：优先从环境变量获取，否则使用默认本地路径"""
+    return os.getenv("EMBED_MODEL_PATH", "e:/github_project/models/bge-large-zh-v1.5")
+
+
+def build_fp32_embedding():
+    """fp32的PyTorch向量模型，向量库中的文档向量都由它计算"""
+    return HuggingFaceEmbeddings(
+        model_name=embed_model_path(),
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+class RAGSystem(object):
+    def __init__(self, config):
+        self.config = config
+        self.llm = ChatOpenAI(
+            model=os.getenv("MODEL", "qwen-plus"),
+            base_url=os.getenv("BASE_URL"),
+            api_key=os.getenv("API_KEY")
+        )
+        self.embedding = self._build_embedding()
+        # 切块和上下文预算按LLM的tokenizer计数；未配置tokenizer时按字符数计
+        self.tokenizer = None
+        if self.config.get("tokenizer_path"):
+            from transformers import AutoTokenizer
+
+            self.tokenizer = AutoTokenizer.from_pretrained(self.config["tokenizer_path"])
+        self.context_packer = ContextPacker(
+            self.config.get("context_tokens", 3000),
+            length_function=self.count_tokens
+        )
+        # 异步查询时执行检索的线程池，线程数即同时进行的检索数上限
+        self.retrieval_executor = ThreadPoolExecutor(
+            max_workers=self.config.get("retrieval_workers", 4),
+            thread_name_prefix="rag-retrieval"
+        )
+        # BM25倒排索引由导入流程维护；hybrid_search 开启且索引非空时与向量检索并行查询
+        self.lexical_executor = ThreadPoolExecutor(
+            max_workers=self.config.get("retrieval_workers", 4),
+            thread_name_prefix="rag-bm25"
+        )
+        # 可选的交叉编码器重排序，未配置模型路径时只用MMR检索
+        self.reranker = None
+        if self.config.get("rerank_model_path"):
+            self.reranker = CrossEncoderReranker(
+                self.config["rerank_model_path"],
+                batch_size=self.config.get("rerank_batch_size", 16),
+                cache_size=self.config.get("rerank_cache_size", 4096)
+            )
+        self.reset_vectorstore()
+
+    def count_tokens(self, text):
+        if self.tokenizer is None:
+            return len(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _build_embedding(self):
+        """embedding_backend 为 onnx 时使用int8量化的ONNX模型，否则使用fp32的PyTorch模型"""
+        if self.config.get("embedding_backend") == "onnx":
+            return OnnxEmbeddings(
+                self.config["onnx_model_dir"],
+                pool_size=self.config.get("onnx_sessions", 2)
+            )
+        return build_fp32_embedding()
+
+    def reset_vectorstore(self):
+        """打开(或重新打开)持久化的向量库并创建检索器"""
+        if self.config.get("vector_backend") == "ann":
+            # 只读的进程内IVF索引，由 rag_ann_store.py import 从Chroma集合导出
+            self.vectorstore = AnnVectorStore(
+                self.config["ann_dir"],
+                self.embedding,
+                nprobe=self.config.get("ann_nprobe", 8)
+            )
+        else:
+            self.vectorstore=Chroma(
+                collection_name=self.config["collection_name"],
+                embedding_function=self.embedding,
+                persist_directory=self.config["persist_dir"]
+            )
+
+        # 只在启用混合检索(或导入时调用 open_lexical_index)才打开倒排索引，只读启动不会在向量库目录下创建文件
+        self.lexical_index = None
+        use_hybrid = False
+        if self.config.get("hybrid_search"):
+            lexical_path = os.path.join(self.config["persist_dir"], BM25_INDEX_NAME)
+            use_hybrid = os.path.exists(lexical_path) and len(self.open_lexical_index()) > 0
+            if not use_hybrid:
+                print("BM25倒排索引不存在或为空，不启用混合检索；可运行 python rag_bm25.py --rebuild 从向量库构建")
+
+        top_k = self.config.get("top_k", 5)
+        # 启用重排序时先多取候选，重排序后再保留top_k个
+        fetch_k = top_k if self.reranker is None else max(self.config.get("rerank_fetch_k", 20), top_k)
+        retriever = MMRRetriever(
+            vectorstore=self.vectorstore,
+            k=fetch_k,
+            fetch_k=max(self.config.get("mmr_fetch_k", 20), fetch_k * 2),
+            lambda_mult=self.config.get("mmr_lambda", 0.5)
+        )
+        if use_hybrid:
+            retriever = HybridRetriever(
+                vector_retriever=retriever,
+                index=self.lexical_index,
+                executor=self.lexical_executor,
+                k=fetch_k,
+                lexical_k=max(self.config.get("bm25_k", 10), fetch_k)
+            )
+        if self.reranker is not None:
+            retriever = RerankRetriever(
+                base_retriever=retriever,
+                reranker=self.reranker,
+                top_k=top_k,
+                budget_ms=self.config.get("rerank_budget_ms", 800)
+            )
+        self.retriver = retriever
+        self.qa_chain = self._build_qa_chain()
+
+    def open_lexical_index(self):
+        """打开(必要时创建)BM25倒排索引，导入流程通过它同步维护索引"""
+        if self.lexical_index is None:
+            self.lexical_index = BM25Index(os.path.join(self.config["persist_dir"], BM25_INDEX_NAME))
+        return self.lexical_index
+
+    def _build_qa_chain(self):
+        """问答链(提示词模板+stuff链)只构建一次，所有查询复用"""
+        return RetrievalQA.from_chain_type(
+            llm=self.llm,
+            retriever=self.retriver,
+            return_source_documents=True
+        )
+
+    def _get_loader(self, path):
+        if path.endswith(".pdf"):
+            return PyPDFLoader(path)
+        elif path.endswith(".txt"):
+            return TextLoader(path, encoding="utf-8")
+        raise ValueError(f"跳过不支持的文件格式: {path}")
+
+    def _load_documents(self, file_paths):
+        docs=[]
+        for path in file_paths:
+            docs.extend(self._get_loader(path).load())
+        return docs
+
+    def _iter_chunks(self, path):
+        """逐个文档加载并切块，不把整个文件的文档块一次性放进内存"""
+        for doc in self._get_loader(path).lazy_load():
+            yield from self._chunk_documents([doc])
+
+    def _chunk_documents(self, docs):
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.config.get("chunk_size", 500),
+            chunk_overlap=self.config.get("chunk_overlap", 50),
+            length_function=self.count_tokens,
+            is_separator_regex=True
+        )
+        return text_splitter.split_documents(docs)
+
+    def build_knowledge(self, file_paths):
+        """增量构建知识库，只有新增或内容变化的文件会被重新切块和向量化"""
+        ingest_files(self, file_paths)
+
+    def _format_result(self, answer, source_documents):
+        return {
+            "answer": answer,
+            "sources":[
+                {
+                    "source": doc.metadata.get("source", "unknown"),
+                    "page": doc.metadata.get("page", "N/A")
+                }
+                for doc in source_documents
+            ]
+        }
+
+    def _retrieve(self, question):
+        """检索后按token预算拼装上下文"""
+        return self.context_packer.pack(self.retriver.invoke(question))
+
+    def query(self, question):
+        docs = self._retrieve(question)
+        result = self.qa_chain.combine_documents_chain.invoke({"input_documents": docs, "question": question})
+        return self._format_result(result["output_text"], docs)
+
+    async def aquery(self, question):
+        """异步问答：检索(向量化+向量库查询, CPU密集)放到线程池，LLM调用走异步客户端，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        docs = await loop.run_in_executor(self.retrieval_executor, self._retrieve, question)
+        result = await self.qa_chain.combine_documents_chain.ainvoke({"input_documents": docs, "question": question})
+        return self._format_result(result["output_text"], docs)
+
+config = {
+    "persist_dir": "./data/rag_db",
+    "collection_name": "rag",
+    # 切块大小和重叠按tokenizer_path(部署的LLM的tokenizer，如Qwen)的token数计，未配置时按字符数计
+    "tokenizer_path": os.getenv("TOKENIZER_PATH", ""),
+    "chunk_size": 500,
+    "chunk_overlap": 50,
+    # 每次问答放入提示词的上下文token上限
+    "context_tokens": 3000,
+    "top_k": 5,
+    "retrieval_workers": 4,
+    # 导入时的向量化: 工作进程数(0表示在当前进程内计算)、每批最多的块数和字符数
+    "embed_workers": 0,
+    "embed_batch_size": 64,
+    "embed_batch_chars": 24000,
+    # 重排序: 模型路径为空时不启用；先取rerank_fetch_k个候选再保留top_k个，超过rerank_budget_ms毫秒则放弃重排序
+    "rerank_model_path": os.getenv("RERANK_MODEL_PATH", ""),
+    "rerank_fetch_k": 20,
+    "rerank_batch_size": 16,
+    "rerank_cache_size": 4096,
+    "rerank_budget_ms": 800,
+    # 查询向量化后端: huggingface(fp32) 或 onnx(int8，需先运行 rag_onnx_embedding.py export)
+    "embedding_backend": os.getenv("EMBEDDING_BACKEND", "huggingface"),
+    "onnx_model_dir": os.getenv("ONNX_EMBED_MODEL_DIR", "./data/onnx/bge-large-zh-v1.5"),
+    "onnx_sessions": 2,
+    # 混合检索: 向量检索与BM25(bm25_k个候选)并行查询后按RRF融合；需先构建倒排索引(rag_ingest.py 或 rag_bm25.py --rebuild)
+    "hybrid_search": os.getenv("HYBRID_SEARCH", "0") == "1",
+    "bm25_k": 10,
+    # MMR: 先取mmr_fetch_k个候选，mmr_lambda越小结果越多样
+    "mmr_fetch_k": 20,
+    "mmr_lambda": 0.5,
+    # 向量检索后端: chroma 或 ann(进程内IVF索引，查询时扫描ann_nprobe个簇)
+    "vector_backend": os.getenv("VECTOR_BACKEND", "chroma"),
+    "ann_dir": "./data/rag_ann",
+    "ann_nprobe": 8
+}
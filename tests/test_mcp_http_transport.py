@@ -0,0 +1,162 @@
+# -*- encoding: utf-8 -*-
+
+"""
+MCP服务网络传输与准入控制的本地测试(不需要模型和LLM)
+
+以子进程启动一个测试服务(--transport streamable-http / sse)，再用本地客户端连接:
+1.多个客户端同时连接同一个服务进程，并发调用工具
+2.并发上限1、排队上限1时，同时到达的第3个请求立即得到"服务繁忙"的错误结果，之后的请求恢复正常
+3.服务监听0.0.0.0时，通过本机的非回环IP访问不会被DNS rebinding防护拒绝，Host请求头不是本机地址的请求仍被拒绝
+
+用法:
+    python tests/test_mcp_http_transport.py
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp import ClientSession
+from mcp.server.fastmcp import FastMCP
+
+from mcp_common.server_runtime import AdmissionController, add_transport_arguments, run_server
+from mcp_common.transport import open_transport
+
+mcp = FastMCP("transport-test")
+admission = AdmissionController(1, 1)
+
+
+@mcp.tool()
+@admission.guard
+async def slow_echo(text: str, seconds: float = 1.0) -> str:
+    """等待 seconds 秒后原样返回 text"""
+    await asyncio.sleep(seconds)
+    return text
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def local_ip():
+    """本机的非回环IP，没有时返回None"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect(("10.255.255.255", 1))
+            ip = sock.getsockname()[0]
+        except OSError:
+            return None
+    return None if ip.startswith("127.") else ip
+
+
+def start_server(transport, host, port):
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--transport", transport,
+         "--host", host, "--port", str(port), "--max-concurrency", "1", "--max-queue", "1"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+async def call(url, text, seconds=1.0):
+    """一个独立的客户端：建立连接、调用一次工具，返回 (是否出错, 文本)"""
+    async with open_transport(url) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            result = await session.call_tool("slow_echo", {"text": text, "seconds": seconds})
+            return result.isError, result.content[0].text
+
+
+async def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await call(url, "ping", seconds=0)
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.3)
+
+
+async def check_admission(url):
+    # 先建立好三个客户端的连接，再让三个调用同时到达
+    async with open_transport(url) as (r1, w1), open_transport(url) as (r2, w2), open_transport(url) as (r3, w3):
+        async with ClientSession(r1, w1) as s1, ClientSession(r2, w2) as s2, ClientSession(r3, w3) as s3:
+            sessions = [s1, s2, s3]
+            await asyncio.gather(*[session.initialize() for session in sessions])
+            results = await asyncio.gather(*[
+                session.call_tool("slow_echo", {"text": f"client-{i}", "seconds": 1.0})
+                for i, session in enumerate(sessions)
+            ])
+    ok = sorted(result.content[0].text for result in results if not result.isError)
+    busy = [result.content[0].text for result in results if result.isError]
+    assert len(ok) == 2 and len(busy) == 1, (ok, busy)
+    assert "服务繁忙" in busy[0], busy[0]
+    print(f"  并发3个请求: 成功 {ok}, 拒绝: {busy[0]}")
+
+    is_error, text = await call(url, "after-busy", seconds=0)
+    assert not is_error and text == "after-busy", text
+    print("  拒绝后再次请求: 成功")
+
+
+def run_case(transport, path):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    print(f"[{transport}] {url}")
+    server = start_server(transport, "127.0.0.1", port)
+    try:
+        asyncio.run(wait_ready(url))
+        asyncio.run(check_admission(url))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_public_host_case():
+    ip = local_ip()
+    if ip is None:
+        print("[0.0.0.0] 没有非回环IP，跳过")
+        return
+    port = free_port()
+    url = f"http://{ip}:{port}/mcp"
+    print(f"[0.0.0.0] {url}")
+    server = start_server("streamable-http", "0.0.0.0", port)
+    try:
+        is_error, text = asyncio.run(wait_ready(url))
+        assert not is_error and text == "ping", text
+        print("  通过本机IP访问: 成功")
+        response = httpx.post(
+            url,
+            headers={"Host": f"attacker.example:{port}", "Content-Type": "application/json",
+                     "Accept": "application/json, text/event-stream"},
+            json={"jsonrpc": "2.0", "id": 1, "method": "ping"}
+        )
+        assert response.status_code == 421, response.status_code
+        print("  Host请求头为其他域名: 拒绝(421)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serve", action="store_true", help="以测试服务的方式运行(由测试自身启动)")
+    add_transport_arguments(parser, default_port=8010, admission=admission)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(mcp, args, admission)
+    else:
+        run_case("streamable-http", "/mcp")
+        run_case("sse", "/sse")
+        run_public_host_case()
+        print("全部通过")